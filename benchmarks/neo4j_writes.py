@@ -0,0 +1,95 @@
+"""Compare serial and scheduled parallel writes of a synthetic graph to Neo4j.
+
+Usage: poetry run python -m benchmarks.neo4j_writes --uri neo4j://localhost:7697
+
+Nodes are written under a dedicated label, only those and the benchmark sync
+metadata are deleted, but a test database is recommended all the same.
+"""
+
+import argparse
+from datetime import datetime
+import time
+from neo4j import Session
+
+from knowledge_bridge.models import EdgeEntity, NodeEntity
+from knowledge_bridge.storage.neo4j import (
+    Neo4jGraphStorage,
+    get_neo4j_driver,
+    get_neo4j_session,
+)
+from knowledge_bridge.storage.scheduling import Neo4jWriteScheduler
+
+# Label of all synthetic nodes, so they can be deleted without touching others
+LABEL = "Benchmark"
+PROVIDER = "benchmark"
+
+
+def synthetic_graph(
+    pages: int, blocks: int
+) -> tuple[list[NodeEntity], list[EdgeEntity]]:
+    now = datetime.now()
+    nodes = []
+    edges = []
+    for page_index in range(pages):
+        page = NodeEntity(
+            id=f"page{page_index}",
+            type=LABEL,
+            created=now,
+            edited=now,
+            link=None,
+            text="{}",
+        )
+        nodes.append(page)
+        # The first page is a hub with most of the blocks
+        page_blocks = blocks // 2 if page_index == 0 else blocks // (2 * pages)
+        for block_index in range(page_blocks):
+            block = NodeEntity(
+                id=f"page{page_index}-block{block_index}",
+                type=LABEL,
+                created=now,
+                edited=now,
+                link=None,
+                text='{"text": "Hello, World!"}',
+            )
+            nodes.append(block)
+            edges.append(EdgeEntity(source=page, target=block, type="CHILD_BLOCK"))
+    return nodes, edges
+
+
+def delete_synthetic_graph(session: Session) -> None:
+    session.run(f"MATCH (n:{LABEL}) DETACH DELETE n")
+    session.run(
+        "MATCH (n:Sync {provider: $provider}) DETACH DELETE n", provider=PROVIDER
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uri", required=True)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--blocks", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    nodes, edges = synthetic_graph(args.pages, args.blocks)
+    print(f"Synthetic graph: {len(nodes)} nodes, {len(edges)} edges")
+
+    with get_neo4j_driver(args.uri) as driver, get_neo4j_session(args.uri) as session:
+        schedulers = {
+            "serial": None,
+            "scheduled": Neo4jWriteScheduler(
+                driver, max_workers=args.workers, chunk_size=args.chunk_size
+            ),
+        }
+        for name, scheduler in schedulers.items():
+            delete_synthetic_graph(session)
+            storage = Neo4jGraphStorage(session, write_scheduler=scheduler)
+            start = time.perf_counter()
+            storage.incremental_data_sync(PROVIDER, nodes, edges)
+            print(f"{name}: {time.perf_counter() - start:.2f}s")
+        delete_synthetic_graph(session)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,64 @@
 from typing import Mapping
+from knowledge_bridge.planning import SyncPlan, plan_sync
+from knowledge_bridge.profiling import NULL_PROFILER, Profiler
 from knowledge_bridge.storage.base import BaseGraphStorage
 from knowledge_bridge.providers.base import TQDM_TYPE, BaseProvider
 
 
 class Bridge(object):
     def __init__(
-        self, graph_storage: BaseGraphStorage, providers: Mapping[str, BaseProvider]
+        self,
+        graph_storage: BaseGraphStorage,
+        providers: Mapping[str, BaseProvider],
+        shared_watermarks: Mapping[str, str] | None = None,
     ) -> None:
         self.graph_storage = graph_storage
         self.providers = providers
+        # Provider name whose watermarks are used instead of the own ones, by
+        # provider name, e.g. a webhook provider sharing a poller's watermarks
+        self.shared_watermarks = shared_watermarks or {}
 
-    def sync(self, tqdm: TQDM_TYPE | None = None):
+    def sync(self, tqdm: TQDM_TYPE | None = None, profile: Profiler | None = None):
+        profiler = profile or NULL_PROFILER
+        self.graph_storage.profiler = profiler
+        try:
+            for name, provider in self.providers.items():
+                if tqdm is not None:
+                    provider.tqdm = tqdm
+                provider.profiler = profiler
+                last_update_ts = self.graph_storage.get_last_sync_timestamp(name)
+                watermarks_name = self.shared_watermarks.get(name, name)
+                provider.watermarks = self.graph_storage.get_watermarks(watermarks_name)
+                with profiler.stage("fetch"):
+                    nodes, edges = provider.get_latest_data(last_update_ts)
+                self.graph_storage.incremental_data_sync(name, nodes, edges)
+                # Persist watermarks and provider state only after the data is stored
+                with profiler.stage("write_sync_metadata"):
+                    self.graph_storage.set_watermarks(
+                        watermarks_name, provider.watermarks
+                    )
+                    provider.commit_state()
+        finally:
+            # Detach the profiler, so later calls (e.g. plan) are not profiled
+            self.graph_storage.profiler = NULL_PROFILER
+            for provider in self.providers.values():
+                provider.profiler = NULL_PROFILER
+            # Report also a failed sync, it stops tracing and writes the dumps
+            if profile is not None:
+                profile.report()
+
+    def plan(
+        self, tqdm: TQDM_TYPE | None = None, chunk_size: int = 10000
+    ) -> dict[str, SyncPlan]:
+        """Dry run of sync: report what would change in the storage, write nothing."""
+        plans = {}
         for name, provider in self.providers.items():
             if tqdm is not None:
                 provider.tqdm = tqdm
             last_update_ts = self.graph_storage.get_last_sync_timestamp(name)
+            provider.watermarks = self.graph_storage.get_watermarks(
+                self.shared_watermarks.get(name, name)
+            )
             nodes, edges = provider.get_latest_data(last_update_ts)
-            self.graph_storage.incremental_data_sync(name, nodes, edges)
+            plans[name] = plan_sync(self.graph_storage, name, nodes, edges, chunk_size)
+        return plans
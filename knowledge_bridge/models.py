@@ -1,7 +1,14 @@
 from datetime import datetime
+import hashlib
+import json
 
 from pydantic import BaseModel
 
+# Types of edges which a provider derives from the content of their source
+# node, so a crawl of the source returns all of them, unlike e.g. CHILD_PAGE
+# edges of a page whose children were not crawled
+CONTENT_EDGE_TYPES = ("RELATES_TO", "MENTIONS", "LINKS_TO", "CHILD_HEADING")
+
 
 class BaseNodeEntity(BaseModel):
     id: str
@@ -22,6 +29,25 @@ class NodeEntity(BaseNodeEntity):
     link: str | None
     text: str | None
     obsolete: bool = False
+    # Set when text is offloaded to a blob store, text is None in that case
+    text_hash: str | None = None
+    text_length: int | None = None
+
+    @property
+    def fingerprint(self) -> str:
+        # Same for a node before and after its text is offloaded to a blob store
+        text_hash = self.text_hash
+        if self.text is not None:
+            text_hash = hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+        content = [
+            self.type,
+            self.created.isoformat(),
+            self.edited.isoformat(),
+            self.link,
+            text_hash,
+            self.obsolete,
+        ]
+        return hashlib.sha256(json.dumps(content).encode("utf-8")).hexdigest()
 
 
 class EdgeEntity(BaseModel):
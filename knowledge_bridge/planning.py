@@ -0,0 +1,64 @@
+from typing import Sequence
+from pydantic import BaseModel
+
+from knowledge_bridge.models import CONTENT_EDGE_TYPES, EdgeEntity, NodeEntity
+from knowledge_bridge.storage.base import BaseGraphStorage
+from knowledge_bridge.storage.scheduling import chunked
+
+
+class SyncPlan(BaseModel):
+    provider: str
+    nodes_to_create: int = 0
+    nodes_to_update: int = 0
+    nodes_unchanged: int = 0
+    nodes_to_obsolete: int = 0
+    edges_to_create: int = 0
+    edges_unchanged: int = 0
+    # Stored references and headings no longer in the re-crawled nodes
+    edges_to_delete: int = 0
+    # Estimated volume of an incremental sync of the same data
+    write_bytes: int = 0
+    transactions: int = 0
+
+
+def plan_sync(
+    graph_storage: BaseGraphStorage,
+    provider: str,
+    nodes: Sequence[NodeEntity],
+    edges: Sequence[EdgeEntity],
+    chunk_size: int = 10000,
+) -> SyncPlan:
+    """Diff provider data against the storage chunk by chunk, without writing."""
+    plan = SyncPlan(provider=provider)
+
+    for chunk in chunked(nodes, chunk_size):
+        stored = graph_storage.get_node_fingerprints(chunk)
+        for node in chunk:
+            plan.write_bytes += len(node.model_dump_json())
+            if node.id not in stored:
+                plan.nodes_to_create += 1
+                continue
+            fingerprint, obsolete = stored[node.id]
+            if fingerprint == node.fingerprint:
+                plan.nodes_unchanged += 1
+            elif node.obsolete and not obsolete:
+                plan.nodes_to_obsolete += 1
+            else:
+                plan.nodes_to_update += 1
+
+    for edges_chunk in chunked(edges, chunk_size):
+        existing = graph_storage.get_existing_edges(edges_chunk)
+        for edge in edges_chunk:
+            plan.write_bytes += (
+                len(edge.source.id) + len(edge.target.id) + len(edge.type)
+            )
+            if (edge.source.id, edge.target.id, edge.type) in existing:
+                plan.edges_unchanged += 1
+            else:
+                plan.edges_to_create += 1
+
+    plan.edges_to_delete = graph_storage.count_stale_edges(
+        nodes, edges, CONTENT_EDGE_TYPES
+    )
+    plan.transactions = graph_storage.estimate_transactions(len(nodes), len(edges))
+    return plan
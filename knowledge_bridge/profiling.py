@@ -0,0 +1,162 @@
+from contextlib import contextmanager, nullcontext
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from typing import ContextManager, Iterator
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("cprofile", "tracemalloc")
+
+
+class BaseProfiler:
+    """Profiler which does nothing, used when profiling is off."""
+
+    _null_context: ContextManager[None] = nullcontext()
+
+    def stage(self, name: str) -> ContextManager[None]:
+        return self._null_context
+
+    def report(self) -> str:
+        return ""
+
+
+NULL_PROFILER = BaseProfiler()
+
+
+class StageStats:
+    def __init__(self) -> None:
+        self.calls = 0
+        # Time and allocated memory exclude nested stages
+        self.seconds = 0.0
+        self.allocated = 0
+        self.profile: cProfile.Profile | None = None
+        self.allocations: dict[str, int] = {}
+
+
+class Profiler(BaseProfiler):
+    """Collects per-stage time and memory statistics of a sync.
+
+    Stages can be nested, e.g. `transform` happens inside `fetch`, the time
+    and memory of a nested stage is attributed only to it. With the
+    `cprofile` backend every stage has its own `cProfile.Profile`, with the
+    `tracemalloc` backend the top allocations of outermost stages are kept.
+    Profile dumps are written to `output_dir` by `report`, if it is set.
+    """
+
+    def __init__(
+        self, backend: str = "cprofile", output_dir: str | None = None, top_n: int = 20
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown profiling backend {backend}, use one of {BACKENDS}"
+            )
+        self.backend = backend
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.stages: dict[str, StageStats] = {}
+        # Stack of [stats, start time, nested time, start memory, nested memory,
+        # start snapshot] of active stages
+        self._stack: list[list] = []
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        stats = self.stages.setdefault(name, StageStats())
+        stats.calls += 1
+        self._enter(stats)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def _enter(self, stats: StageStats) -> None:
+        snapshot = None
+        if self.backend == "cprofile":
+            if self._stack:
+                self._stack[-1][0].profile.disable()
+            if stats.profile is None:
+                stats.profile = cProfile.Profile()
+            stats.profile.enable()
+        else:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            if not self._stack:
+                snapshot = tracemalloc.take_snapshot()
+        memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        self._stack.append([stats, time.perf_counter(), 0.0, memory, 0, snapshot])
+
+    def _exit(self) -> None:
+        stats, start, nested_time, start_memory, nested_memory, snapshot = (
+            self._stack.pop()
+        )
+        elapsed = time.perf_counter() - start
+        stats.seconds += elapsed - nested_time
+
+        if self.backend == "cprofile":
+            assert stats.profile is not None
+            stats.profile.disable()
+            if self._stack:
+                self._stack[-1][0].profile.enable()
+            allocated = 0
+        else:
+            allocated = tracemalloc.get_traced_memory()[0] - start_memory
+            stats.allocated += allocated - nested_memory
+            if snapshot is not None:
+                diff = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+                for stat in diff:
+                    key = str(stat.traceback)
+                    stats.allocations[key] = (
+                        stats.allocations.get(key, 0) + stat.size_diff
+                    )
+
+        if self._stack:
+            self._stack[-1][2] += elapsed
+            self._stack[-1][4] += allocated
+
+    def report(self) -> str:
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+        lines = []
+        for name, stats in self.stages.items():
+            line = f"{name}: {stats.calls} calls, {stats.seconds:.3f}s"
+            if self.backend == "tracemalloc":
+                line += f", {stats.allocated / 1024:.1f} KiB allocated"
+            lines.append(line)
+
+            if stats.profile is not None:
+                stream = io.StringIO()
+                profile_stats = pstats.Stats(stats.profile, stream=stream)
+                profile_stats.sort_stats("tottime").print_stats(self.top_n)
+                lines.append(stream.getvalue())
+                if self.output_dir is not None:
+                    stats.profile.dump_stats(
+                        os.path.join(self.output_dir, f"{name}.prof")
+                    )
+
+            if stats.allocations:
+                top = sorted(
+                    stats.allocations.items(), key=lambda item: item[1], reverse=True
+                )
+                allocations = [
+                    f"  {size / 1024:.1f} KiB {location}" for location, size in top
+                ]
+                lines.extend(allocations[: self.top_n])
+                if self.output_dir is not None:
+                    path = os.path.join(self.output_dir, f"{name}.tracemalloc.txt")
+                    with open(path, "w") as f:
+                        f.write("\n".join(allocations))
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        summary = "\n".join(lines)
+        logger.info(f"Sync profile:\n{summary}")
+        return summary
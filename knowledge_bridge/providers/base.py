@@ -1,9 +1,10 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import Callable, Concatenate, ParamSpec
+from typing import Callable, Concatenate, ParamSpec, Sequence
 from typing_extensions import TypeVar
 
 from ..models import EdgeEntity, NodeEntity
+from ..profiling import NULL_PROFILER, BaseProfiler
 
 T = TypeVar("T")
 P = ParamSpec("P")
@@ -14,9 +15,23 @@ class BaseProvider(ABC):
     def __init__(self) -> None:
         # Optional tqdm decorator which can be overriden by class user
         self.tqdm: TQDM_TYPE = lambda x, *args, **kwargs: x  # type: ignore
+        # Fine-grained sync watermarks per container (e.g. database or page id),
+        # loaded from and persisted to the graph storage by the bridge
+        self.watermarks: dict[str, datetime] = {}
+        # Profiler of sync stages, set by the bridge when profiling is on
+        self.profiler: BaseProfiler = NULL_PROFILER
+        # Counters of the latest sync, e.g. peak memory usage
+        self.metrics: dict[str, int] = {}
 
     @abstractmethod
     def get_latest_data(
         self, last_sync_timestamp: datetime | None
-    ) -> tuple[list[NodeEntity], list[EdgeEntity]]:
+    ) -> tuple[Sequence[NodeEntity], Sequence[EdgeEntity]]:
         raise NotImplementedError
+
+    def commit_state(self) -> None:
+        """Persist provider-side state of the latest fetch.
+
+        Called by the bridge only after the fetched data is stored, like
+        watermarks. A fetch without commit (e.g. a dry run) changes nothing.
+        """
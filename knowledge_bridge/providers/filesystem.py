@@ -0,0 +1,381 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+from typing import Iterable, Iterator, Sequence, Tuple
+from urllib.parse import unquote
+
+from ..models import BaseNodeEntity, EdgeEntity, NodeEntity
+
+from .base import BaseProvider
+
+logger = logging.getLogger(__name__)
+
+HEADING_RE = re.compile(rb"^(#{1,6})[ \t]+(.+?)[ \t#]*\r?$", re.MULTILINE)
+FENCE_RE = re.compile(rb"^[ \t]{0,3}(`{3,}|~{3,})(.*)$", re.MULTILINE)
+MARKDOWN_LINK_RE = re.compile(rb"\[[^\]]*\]\(([^)\s]+)[^)]*\)")
+WIKI_LINK_RE = re.compile(rb"\[\[([^\]|#]+)(?:#[^\]|]*)?(?:\|[^\]]*)?\]\]")
+SLUG_RE = re.compile(r"[^\w\- ]")
+
+
+def file_id(path: str) -> str:
+    return f"file:{path}"
+
+
+def heading_id(path: str, slug: str) -> str:
+    return f"file:{path}#{slug}"
+
+
+def heading_slug(title: str, seen: dict[str, int]) -> str:
+    """Anchor of a heading like GitHub's, repeated titles get a counter suffix."""
+    slug = SLUG_RE.sub("", title.lower()).strip().replace(" ", "-")
+    count = seen.get(slug, 0)
+    seen[slug] = count + 1
+    return f"{slug}-{count}" if count else slug
+
+
+def fenced_ranges(content: bytes | mmap.mmap) -> list[Tuple[int, int]]:
+    """Offsets of fenced code blocks, an unclosed fence runs to the end."""
+    ranges = []
+    opening: re.Match[bytes] | None = None
+    for match in FENCE_RE.finditer(content):
+        fence = match.group(1)
+        if opening is None:
+            opening = match
+        elif (
+            fence[:1] == opening.group(1)[:1]
+            and len(fence) >= len(opening.group(1))
+            and not match.group(2).strip()
+        ):
+            ranges.append((opening.start(), match.end()))
+            opening = None
+    if opening is not None:
+        ranges.append((opening.start(), len(content)))
+    return ranges
+
+
+class FileState:
+    def __init__(
+        self,
+        mtime_ns: int,
+        size: int,
+        digest: str,
+        created: float | None = None,
+        headings: Sequence[str] = (),
+    ):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        # Creation timestamp, kept where the file system doesn't record it and
+        # to emit removed files and headings without losing it
+        self.created = created
+        self.headings = list(headings)
+
+
+def created_timestamp(stat: os.stat_result, state: FileState | None) -> float:
+    # st_ctime is the inode change time on Linux, it moves on every edit, so
+    # the first one seen is kept
+    birthtime = getattr(stat, "st_birthtime", None)
+    if birthtime is not None:
+        return birthtime
+    if state is not None and state.created is not None:
+        return state.created
+    return stat.st_ctime
+
+
+class FileSystemProvider(BaseProvider):
+    """Provider for a directory tree of Markdown files (e.g. an Obsidian vault).
+
+    Directories are scanned in parallel with `os.scandir`. A file is read only
+    if its mtime or size differs from the index of the previous sync, and is
+    emitted only if its content hash changed as well. Files removed since the
+    previous sync are emitted as obsolete. The index is kept in `index_path`,
+    without it a file is considered changed if it was modified after
+    `last_sync_timestamp`. The index of a fetch is saved by `commit_state`,
+    once the fetched data is stored.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        index_path: str | None = None,
+        extensions: Tuple[str, ...] = (".md", ".markdown"),
+        max_workers: int = 16,
+        mmap_threshold: int = 1024 * 1024,
+    ):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path
+        self.extensions = extensions
+        self.max_workers = max_workers
+        # Files larger than this are read through memory-mapped I/O
+        self.mmap_threshold = mmap_threshold
+        self.index: dict[str, FileState] = self._load_index()
+        # Index of the latest fetch, if it differs from the saved one
+        self.pending_index: dict[str, FileState] | None = None
+
+        super().__init__()
+
+    def get_latest_data(
+        self, last_sync_timestamp: datetime | None
+    ) -> Tuple[list[NodeEntity], list[EdgeEntity]]:
+        nodes: list[NodeEntity] = []
+        edges: list[EdgeEntity] = []
+        seen = set()
+        index = dict(self.index)
+        index_changed = False
+        since_ns = None
+        if not self.index and last_sync_timestamp is not None:
+            since_ns = int(
+                last_sync_timestamp.replace(tzinfo=timezone.utc).timestamp() * 1e9
+            )
+
+        files = list(self.tqdm(self._scan(), desc="Scanning files"))
+        names = self._link_names(path for path, _ in files)
+        for path, stat in files:
+            seen.add(path)
+            state = index.get(path)
+            if state is not None and (stat.st_mtime_ns, stat.st_size) == (
+                state.mtime_ns,
+                state.size,
+            ):
+                continue
+            if state is None and since_ns is not None and stat.st_mtime_ns <= since_ns:
+                continue
+
+            index_changed = True
+            with self._content(path, stat.st_size) as content:
+                digest = hashlib.sha256(content).hexdigest()
+                if state is not None and state.digest == digest:
+                    # Touched, but not modified
+                    index[path] = FileState(
+                        stat.st_mtime_ns,
+                        stat.st_size,
+                        digest,
+                        state.created,
+                        state.headings,
+                    )
+                    continue
+
+                logger.info(f"Processing file {path}")
+                created = created_timestamp(stat, state)
+                with self.profiler.stage("transform"):
+                    file_nodes, file_edges = self._parse(
+                        path, stat, created, content, names
+                    )
+            nodes.extend(file_nodes)
+            edges.extend(file_edges)
+
+            slugs = [
+                node.id.split("#", 1)[1]
+                for node in file_nodes
+                if node.type == "Heading"
+            ]
+            index[path] = FileState(
+                stat.st_mtime_ns, stat.st_size, digest, created, slugs
+            )
+            if state is not None:
+                # Headings which were removed or renamed by the edit
+                removed = [slug for slug in state.headings if slug not in set(slugs)]
+                nodes.extend(self._obsolete_headings(path, state, removed))
+
+        for path in list(index):
+            if path not in seen:
+                logger.info(f"File {path} was removed")
+                state = index.pop(path)
+                index_changed = True
+                nodes.append(self._obsolete_node(file_id(path), "File", state))
+                nodes.extend(self._obsolete_headings(path, state, state.headings))
+
+        self.pending_index = index if index_changed else None
+        return nodes, edges
+
+    def commit_state(self) -> None:
+        if self.pending_index is None:
+            return
+        self.index = self.pending_index
+        self.pending_index = None
+        self._save_index()
+
+    def _scan(self) -> Iterator[Tuple[str, os.stat_result]]:
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            pending = [executor.submit(self._scan_directory, self.root)]
+            while pending:
+                files, directories = pending.pop().result()
+                pending.extend(
+                    executor.submit(self._scan_directory, directory)
+                    for directory in directories
+                )
+                yield from files
+
+    def _scan_directory(
+        self, directory: str
+    ) -> Tuple[list[Tuple[str, os.stat_result]], list[str]]:
+        files = []
+        directories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.is_file() and entry.name.endswith(self.extensions):
+                        path = os.path.relpath(entry.path, self.root)
+                        files.append((path.replace(os.sep, "/"), entry.stat()))
+        except OSError as e:
+            logger.warning(f"Can't scan directory {directory}: {e}")
+        return files, directories
+
+    @staticmethod
+    def _link_names(paths: Iterable[str]) -> dict[str, str]:
+        """Paths by file name, the file closest to the root wins on conflicts."""
+        names: dict[str, str] = {}
+        for path in sorted(paths, key=lambda path: (path.count("/"), path)):
+            names.setdefault(path.rsplit("/", 1)[-1], path)
+        return names
+
+    def _obsolete_node(self, id: str, type: str, state: FileState) -> NodeEntity:
+        now = datetime.now(timezone.utc)
+        return NodeEntity(
+            id=id,
+            type=type,
+            created=(
+                datetime.fromtimestamp(state.created, timezone.utc)
+                if state.created is not None
+                else now
+            ),
+            edited=now,
+            link=None,
+            text=None,
+            obsolete=True,
+        )
+
+    def _obsolete_headings(
+        self, path: str, state: FileState, slugs: Iterable[str]
+    ) -> list[NodeEntity]:
+        return [
+            self._obsolete_node(heading_id(path, slug), "Heading", state)
+            for slug in slugs
+        ]
+
+    @contextmanager
+    def _content(self, path: str, size: int) -> Iterator[bytes | mmap.mmap]:
+        # Large files are hashed and scanned through the mapping, without
+        # copying them into memory
+        with open(os.path.join(self.root, path), "rb") as f:
+            if size < self.mmap_threshold or size == 0:
+                yield f.read()
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def _parse(
+        self,
+        path: str,
+        stat: os.stat_result,
+        created_ts: float,
+        content: bytes | mmap.mmap,
+        names: dict[str, str],
+    ) -> Tuple[list[NodeEntity], list[EdgeEntity]]:
+        created = datetime.fromtimestamp(created_ts, timezone.utc)
+        edited = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+        file = NodeEntity(
+            id=file_id(path),
+            type="File",
+            created=created,
+            edited=edited,
+            link=os.path.join(self.root, path),
+            text=str(content, "utf-8", errors="replace"),
+        )
+        nodes = [file]
+        edges = []
+
+        # Headings form a tree under the file by their level
+        parents: list[Tuple[int, NodeEntity]] = [(0, file)]
+        slugs: dict[str, int] = {}
+        # Lines starting with # in code blocks (e.g. shell comments) are skipped
+        fenced = iter(fenced_ranges(content))
+        fence = next(fenced, None)
+        for match in HEADING_RE.finditer(content):
+            while fence is not None and fence[1] <= match.start():
+                fence = next(fenced, None)
+            if fence is not None and fence[0] <= match.start():
+                continue
+            level = len(match.group(1))
+            title = match.group(2).decode("utf-8", "replace")
+            heading = NodeEntity(
+                id=heading_id(path, heading_slug(title, slugs)),
+                type="Heading",
+                created=created,
+                edited=edited,
+                link=None,
+                text=json.dumps({"level": level, "title": title}),
+            )
+            while parents[-1][0] >= level:
+                parents.pop()
+            edges.append(
+                EdgeEntity(source=parents[-1][1], target=heading, type="CHILD_HEADING")
+            )
+            parents.append((level, heading))
+            nodes.append(heading)
+
+        targets = set()
+        for match in MARKDOWN_LINK_RE.finditer(content):
+            target = unquote(match.group(1).decode("utf-8", "replace")).split("#")[0]
+            if target and "://" not in target and target.endswith(self.extensions):
+                targets.add(
+                    os.path.normpath(os.path.join(os.path.dirname(path), target))
+                )
+        # Wiki links name a file anywhere in the vault like in Obsidian, those
+        # with a path are resolved relative to the root
+        for match in WIKI_LINK_RE.finditer(content):
+            target = match.group(1).decode("utf-8", "replace").strip()
+            if not target.endswith(self.extensions):
+                target += self.extensions[0]
+            if "/" not in target:
+                target = names.get(target, target)
+            targets.add(target)
+        for target in targets:
+            edges.append(
+                EdgeEntity(
+                    source=file,
+                    target=BaseNodeEntity(
+                        id=file_id(target.replace(os.sep, "/")), type="File"
+                    ),
+                    type="LINKS_TO",
+                )
+            )
+
+        return nodes, edges
+
+    def _load_index(self) -> dict[str, FileState]:
+        if self.index_path is None or not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as f:
+            return {path: FileState(*state) for path, state in json.load(f).items()}
+
+    def _save_index(self) -> None:
+        if self.index_path is None:
+            return
+        # Write to a temporary file first, so a crash never leaves a broken index
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    path: [
+                        state.mtime_ns,
+                        state.size,
+                        state.digest,
+                        state.created,
+                        state.headings,
+                    ]
+                    for path, state in self.index.items()
+                },
+                f,
+            )
+        os.replace(tmp_path, self.index_path)
@@ -1,20 +1,41 @@
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 import logging
-from typing import Tuple
+from typing import Iterable, Iterator, Mapping, Sequence, Tuple
 from notion_client import APIResponseError, Client
 
 from ..models import EdgeEntity, NodeEntity
 
 from .base import BaseProvider
+from .state import CrawlState, peak_rss_bytes
 
 logger = logging.getLogger(__name__)
 
+# Node type of referenced objects by the kind of reference in mentions and
+# link_to_page blocks
+REFERENCE_TYPES = {
+    "page": "Page",
+    "page_id": "Page",
+    "database": "Database",
+    "database_id": "Database",
+}
+# Node type of a parent by the parent type of a page, database or block
+PARENT_TYPES = {**REFERENCE_TYPES, "block_id": "Block"}
+
 
 def parse_datetime(value: str) -> datetime:
     return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ")
 
 
+def format_datetime(value: datetime) -> str:
+    return value.isoformat(timespec="milliseconds") + "Z"
+
+
+def crawl_watermark() -> datetime:
+    """Current time rounded down to the minute, like Notion edit times."""
+    return datetime.now(timezone.utc).replace(tzinfo=None, second=0, microsecond=0)
+
+
 def process_paginated(endpoint_method, last_edited_time=None, **kwargs):
     next_cursor = None
     while True:
@@ -32,67 +53,169 @@ def process_paginated(endpoint_method, last_edited_time=None, **kwargs):
         next_cursor = response["next_cursor"]
 
 
+def extract_mentions(rich_text: Iterable[dict]) -> Iterator[Tuple[str, str]]:
+    """Yield ids and node types of pages and databases mentioned in rich text."""
+    for item in rich_text:
+        if item.get("type") != "mention":
+            continue
+        mention = item["mention"]
+        if mention.get("type") in REFERENCE_TYPES:
+            yield mention[mention["type"]]["id"], REFERENCE_TYPES[mention["type"]]
+
+
 class NotionProvider(BaseProvider):
-    def __init__(self, client: Client):
+    def __init__(
+        self,
+        client: Client,
+        memory_budget: int | None = None,
+        spill_dir: str | None = None,
+    ):
         self.client = client
-        self.edges: set[Tuple[str, str, str]] = set()
-        self.nodes: dict[str, NodeEntity] = {}
+        # Node payloads above memory_budget bytes are spilled to spill_dir
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.state = CrawlState(memory_budget, spill_dir)
+        # Pages and databases returned by search, by id
+        self.prefetched: dict[str, dict] = {}
+        # Kind of referenced objects which are retrieved after the crawl, by id
+        self.deferred: dict[str, str] = {}
+        # Watermark of containers crawled from now on
+        self.crawl_started = crawl_watermark()
 
         super().__init__()
 
     def get_latest_data(
         self, last_sync_timestamp: datetime | None
-    ) -> Tuple[list[NodeEntity], list[EdgeEntity]]:
-        pages = process_paginated(
-            self.client.search,
-            last_edited_time=last_sync_timestamp,
-            query="",
-            filter={"value": "page", "property": "object"},
-        )
-        for page in self.tqdm(pages, desc="Processing pages"):
-            self._process_page(page)
+    ) -> Tuple[Sequence[NodeEntity], Sequence[EdgeEntity]]:
+        self.state = CrawlState(self.memory_budget, self.spill_dir)
+        self.crawl_started = crawl_watermark()
 
-        databases = process_paginated(
-            self.client.search,
-            last_edited_time=last_sync_timestamp,
-            query="",
-            filter={"value": "database", "property": "object"},
+        # Search results are collected first, so child pages and databases
+        # can be resolved from them instead of retrieving them one by one.
+        # Objects are kept only in the prefetch map and removed from it once
+        # processed, only their ids are kept in the search order.
+        self._reset_children({})
+        page_ids = self._prefetch(
+            process_paginated(
+                self.client.search,
+                last_edited_time=last_sync_timestamp,
+                query="",
+                filter={"value": "page", "property": "object"},
+            )
         )
-        for database in self.tqdm(databases, desc="Processing databases"):
-            self._process_database(database)
-
-        return (
-            list(self.nodes.values()),
-            [
-                EdgeEntity(
-                    source=self.nodes[source], target=self.nodes[target], type=type
-                )
-                for source, target, type in self.edges
-            ],
+        database_ids = self._prefetch(
+            process_paginated(
+                self.client.search,
+                last_edited_time=last_sync_timestamp,
+                query="",
+                filter={"value": "database", "property": "object"},
+            )
         )
 
-    def _process_page(self, page):
-        if page["id"] in self.nodes:
+        for page_id in self.tqdm(page_ids, desc="Processing pages"):
+            page = self.prefetched.pop(page_id, None)
+            if page is not None:
+                self._process_page(page)
+
+        for database_id in self.tqdm(database_ids, desc="Processing databases"):
+            database = self.prefetched.pop(database_id, None)
+            if database is not None:
+                self._process_database(database)
+
+        self._process_deferred()
+        return self._collect()
+
+    def get_targeted_data(
+        self,
+        pages: Mapping[str, bool],
+        databases: Iterable[str] = (),
+        blocks: Iterable[str] = (),
+    ) -> Tuple[Sequence[NodeEntity], Sequence[EdgeEntity]]:
+        """Fetch only the given objects instead of searching the workspace.
+
+        `pages` maps page ids to whether all their blocks should be fetched too.
+        """
+        self.state = CrawlState(self.memory_budget, self.spill_dir)
+        self.crawl_started = crawl_watermark()
+        self._reset_children({})
+
+        for page_id, with_blocks in self.tqdm(pages.items(), desc="Processing pages"):
+            page = self._retrieve(self.client.pages.retrieve, page_id, "page")
+            if page is not None:
+                self._process_page(page, with_blocks=with_blocks)
+
+        for database_id in self.tqdm(databases, desc="Processing databases"):
+            database = self._retrieve(
+                self.client.databases.retrieve, database_id, "database"
+            )
+            if database is not None:
+                self._process_database(database)
+
+        for block_id in self.tqdm(blocks, desc="Processing blocks"):
+            block = self._retrieve(self.client.blocks.retrieve, block_id, "block")
+            if block is not None:
+                self._process_block(block)
+
+        self._process_deferred()
+        return self._collect()
+
+    def _collect(self) -> Tuple[Sequence[NodeEntity], Sequence[EdgeEntity]]:
+        nodes = self.state.nodes()
+        with self.profiler.stage("transform"):
+            edges = self.state.edge_entities()
+        self.metrics["nodes"] = len(nodes)
+        self.metrics["edges"] = len(edges)
+        self.metrics["spilled_nodes"] = self.state.spilled
+        peak_rss = peak_rss_bytes()
+        if peak_rss is not None:
+            self.metrics["peak_rss_bytes"] = peak_rss
+        logger.info(f"Crawl metrics: {self.metrics}")
+        return nodes, edges
+
+    def _retrieve(self, endpoint_method, object_id: str, kind: str):
+        try:
+            return endpoint_method(object_id)
+        except APIResponseError as e:
+            if e.status == 404:
+                logger.warning(
+                    f"Referenced {kind} {object_id} not found, most likely not shared with the integration. Skipping."
+                )
+                return None
+            raise
+
+    def _process_page(self, page, with_blocks: bool = True):
+        if page["id"] in self.state:
             logger.info(f"Skipping processed page {page['id']}")
             return
 
         logger.info(f"Processing page {page['id']}")
-        node = NodeEntity(
-            id=page["id"],
-            type="Page",
-            created=page["created_time"],
-            edited=page["last_edited_time"],
-            # Dump all content as json
-            text=json.dumps(page["properties"]),
-            obsolete=page.get("in_trash", False),
-            link=page["url"],
-        )
-        self.nodes[node.id] = node
+        with self.profiler.stage("transform"):
+            node = NodeEntity(
+                id=page["id"],
+                type="Page",
+                created=page["created_time"],
+                edited=page["last_edited_time"],
+                # Dump all content as json
+                text=json.dumps(page["properties"]),
+                obsolete=page.get("in_trash", False),
+                link=page["url"],
+            )
+        self.state.add_node(node)
+        for target, type, target_type in self._page_references(page):
+            self.state.add_edge(node.id, target, type, target_type)
 
         parent = page["parent"]
-        if parent["type"] != "workspace":
-            edge = (parent[parent["type"]], node.id, "CHILD_PAGE")
-            self.edges.add(edge)
+        self._add_child_edge(parent, node.id, "CHILD_PAGE")
+
+        if not with_blocks:
+            return
+
+        if parent["type"] == "workspace" and not self._advance_watermark(
+            node.id, parse_datetime(page["last_edited_time"])
+        ):
+            # Top-level page content was not edited since the last sync
+            logger.info(f"Skipping blocks of unchanged page {page['id']}")
+            return
 
         blocks = process_paginated(
             self.client.blocks.children.list, block_id=page["id"]
@@ -102,54 +225,36 @@ class NotionProvider(BaseProvider):
             self._process_block(block)
 
     def _process_block(self, block):
-        if block["id"] in self.nodes:
+        if block["id"] in self.state:
             logger.info(f"Skipping processed block {block['id']}")
             return
 
         logger.info(f"Processing block {block['id']}")
 
         if block["type"] == "child_page":
-            try:
-                page = self.client.pages.retrieve(block["id"])
-            except APIResponseError as e:
-                if e.status == 404:
-                    logger.warning(
-                        f"Referenced page {block['id']} not found, most likely not shared with the integration. Skipping."
-                    )
-                    return
-                raise
-            self._process_page(page)
+            self._process_child(block["id"], "page")
             return
 
         if block["type"] == "child_database":
-            try:
-                database = self.client.databases.retrieve(block["id"])
-            except APIResponseError as e:
-                if e.status == 404:
-                    logger.warning(
-                        f"Referenced database {block['id']} not found, most likely not shared with the integration. Skipping."
-                    )
-                    return
-                raise
-            self._process_database(database)
+            self._process_child(block["id"], "database")
             return
 
-        node = NodeEntity(
-            id=block["id"],
-            type="Block",
-            created=block["created_time"],
-            edited=block["last_edited_time"],
-            # Dump all content as json
-            text=json.dumps(block[block["type"]]),
-            obsolete=block.get("in_trash", False),
-            link=None,
-        )
-        self.nodes[node.id] = node
+        with self.profiler.stage("transform"):
+            node = NodeEntity(
+                id=block["id"],
+                type="Block",
+                created=block["created_time"],
+                edited=block["last_edited_time"],
+                # Dump all content as json
+                text=json.dumps(block[block["type"]]),
+                obsolete=block.get("in_trash", False),
+                link=None,
+            )
+        self.state.add_node(node)
+        for target, type, target_type in self._block_references(block):
+            self.state.add_edge(node.id, target, type, target_type)
 
-        parent = block["parent"]
-        if parent["type"] != "workspace":
-            edge = (parent[parent["type"]], node.id, "CHILD_BLOCK")
-            self.edges.add(edge)
+        self._add_child_edge(block["parent"], node.id, "CHILD_BLOCK")
 
         if block.get("has_children"):
             children = process_paginated(
@@ -159,31 +264,148 @@ class NotionProvider(BaseProvider):
                 self._process_block(child)
 
     def _process_database(self, database):
-        if database["id"] in self.nodes:
+        if database["id"] in self.state:
             logger.info(f"Skipping processed database {database['id']}")
             return
 
         logger.info(f"Processing database {database['id']}")
-        node = NodeEntity(
-            id=database["id"],
-            type="Database",
-            created=database["created_time"],
-            edited=database["last_edited_time"],
-            # Dump all content as json
-            text=json.dumps(database["properties"]),
-            obsolete=database.get("in_trash", False),
-            link=None,
-        )
-        self.nodes[node.id] = node
+        with self.profiler.stage("transform"):
+            node = NodeEntity(
+                id=database["id"],
+                type="Database",
+                created=database["created_time"],
+                edited=database["last_edited_time"],
+                # Dump all content as json
+                text=json.dumps(database["properties"]),
+                obsolete=database.get("in_trash", False),
+                link=None,
+            )
+        self.state.add_node(node)
 
-        parent = database["parent"]
-        if parent["type"] != "workspace":
-            edge = (parent[parent["type"]], node.id, "CHILD_DATABASE")
-            self.edges.add(edge)
+        self._add_child_edge(database["parent"], node.id, "CHILD_DATABASE")
 
+        # Read only rows edited since the last sync of this database
+        watermark = self.watermarks.get(database["id"])
+        query_filter = {}
+        if watermark is not None:
+            query_filter["filter"] = {
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": format_datetime(watermark)},
+            }
         pages = process_paginated(
-            self.client.databases.query, database_id=database["id"]
+            self.client.databases.query,
+            last_edited_time=watermark,
+            database_id=database["id"],
+            sorts=[{"timestamp": "last_edited_time", "direction": "descending"}],
+            **query_filter,
         )
 
         for page in pages:
             self._process_page(page)
+        self.watermarks[database["id"]] = self.crawl_started
+
+    def _add_child_edge(self, parent, child_id: str, type: str) -> None:
+        if parent["type"] == "workspace":
+            return
+        # The parent is often not crawled by an incremental sync, e.g. the
+        # unchanged database of a new row, so its type is kept as a hint
+        self.state.add_edge(
+            parent[parent["type"]],
+            child_id,
+            type,
+            source_type=PARENT_TYPES.get(parent["type"]),
+        )
+
+    def _reset_children(self, prefetched: dict[str, dict]) -> None:
+        self.prefetched = prefetched
+        self.deferred = {}
+        self.metrics["saved_api_calls"] = 0
+        self.metrics["deferred_retrievals"] = 0
+
+    def _prefetch(self, objects: Iterable[dict]) -> list[str]:
+        ids = []
+        for obj in objects:
+            self.prefetched[obj["id"]] = obj
+            ids.append(obj["id"])
+        return ids
+
+    def _process_child(self, object_id: str, kind: str) -> None:
+        obj = self.prefetched.pop(object_id, None)
+        if obj is None:
+            self.deferred[object_id] = kind
+            return
+
+        self._count("saved_api_calls")
+        if kind == "page":
+            self._process_page(obj)
+        else:
+            self._process_database(obj)
+
+    def _process_deferred(self) -> None:
+        """Retrieve child pages and databases which were not found by search."""
+        # Processing a retrieved object can defer more objects
+        while self.deferred:
+            object_id = next(iter(self.deferred))
+            kind = self.deferred.pop(object_id)
+            if object_id in self.state:
+                # Reached from another place in the meantime
+                continue
+
+            self._count("deferred_retrievals")
+            if kind == "page":
+                page = self._retrieve(self.client.pages.retrieve, object_id, "page")
+                if page is not None:
+                    self._process_page(page)
+            else:
+                database = self._retrieve(
+                    self.client.databases.retrieve, object_id, "database"
+                )
+                if database is not None:
+                    self._process_database(database)
+
+    def _count(self, metric: str) -> None:
+        self.metrics[metric] = self.metrics.get(metric, 0) + 1
+
+    def _page_references(self, page) -> Iterator[Tuple[str, str, str]]:
+        for property in page["properties"].values():
+            if property.get("type") == "relation":
+                for relation in self._relations(page["id"], property):
+                    yield relation["id"], "RELATES_TO", "Page"
+            elif property.get("type") in ("title", "rich_text"):
+                for target, target_type in extract_mentions(property[property["type"]]):
+                    yield target, "MENTIONS", target_type
+
+    def _relations(self, page_id: str, property) -> Iterable[dict]:
+        if not property.get("has_more"):
+            return property["relation"]
+        # Only the first 25 relations are included in the page object
+        items = process_paginated(
+            self.client.pages.properties.retrieve,
+            page_id=page_id,
+            property_id=property["id"],
+        )
+        return [item["relation"] for item in items]
+
+    def _block_references(self, block) -> Iterator[Tuple[str, str, str]]:
+        content = block[block["type"]]
+        if block["type"] == "link_to_page":
+            kind = content.get("type")
+            if kind in REFERENCE_TYPES:
+                yield content[kind], "LINKS_TO", REFERENCE_TYPES[kind]
+            return
+        # Older API versions name rich text "text"
+        rich_text = content.get("rich_text", content.get("text", []))
+        for target, target_type in extract_mentions(rich_text):
+            yield target, "MENTIONS", target_type
+
+    def _advance_watermark(self, container_id: str, timestamp: datetime) -> bool:
+        """Move the watermark of a container edited since the last crawl to the
+        start of this one, return whether it was edited."""
+        watermark = self.watermarks.get(container_id)
+        # Notion rounds last_edited_time down to the minute and the watermark is
+        # rounded the same way, so an object edited in the same minute as the
+        # last crawl started is crawled again
+        if watermark is not None and timestamp < watermark:
+            return False
+        self.watermarks[container_id] = self.crawl_started
+        return True
@@ -0,0 +1,211 @@
+from datetime import datetime
+import hashlib
+import hmac
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+import time
+from typing import Callable, Sequence, Tuple
+
+from ..models import EdgeEntity, NodeEntity
+
+from .base import BaseProvider
+from .notion import NotionProvider
+
+logger = logging.getLogger(__name__)
+
+# Page events after which the whole page content is fetched again, for other
+# page events only the page itself and the updated blocks are fetched
+FULL_PAGE_EVENTS = {"page.created", "page.content_updated", "page.undeleted"}
+
+
+class PendingChange:
+    def __init__(self, kind: str, last_event: float):
+        self.kind = kind
+        self.last_event = last_event
+        self.with_blocks = False
+        self.blocks: set[str] = set()
+
+
+class NotionWebhookReceiver:
+    """Lightweight HTTP receiver for Notion webhook change notifications.
+
+    Events are coalesced per page (or database) id. A change is handed out by
+    `drain` once no new events arrived for it within `debounce` seconds.
+    If `verification_token` is set, requests without a valid
+    `X-Notion-Signature` header are rejected.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        debounce: float = 5.0,
+        verification_token: str | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.debounce = debounce
+        self.verification_token = verification_token
+        self.received_verification_token: str | None = None
+        self.clock = clock
+        self.pending: dict[str, PendingChange] = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        if isinstance(host, bytes):
+            host = host.decode()
+        return f"http://{host}:{port}/"
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Listening for Notion webhooks on {self.url}")
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def add_event(self, event: dict) -> None:
+        if "verification_token" in event:
+            # Sent once by Notion when the subscription is created, the token
+            # is a secret, so it is kept for the user instead of being logged
+            self.received_verification_token = event["verification_token"]
+            logger.warning(
+                "Received webhook verification token, read it from received_verification_token"
+            )
+            return
+
+        entity = event.get("entity", {})
+        if entity.get("type") not in ("page", "database"):
+            logger.info(f"Ignoring webhook event {event.get('type')}")
+            return
+
+        with self.lock:
+            change = self.pending.get(entity["id"])
+            if change is None:
+                change = PendingChange(entity["type"], self.clock())
+                self.pending[entity["id"]] = change
+            change.last_event = self.clock()
+
+            updated_blocks = event.get("data", {}).get("updated_blocks", [])
+            if event.get("type") in FULL_PAGE_EVENTS and not updated_blocks:
+                change.with_blocks = True
+            change.blocks.update(block["id"] for block in updated_blocks)
+
+    def drain(self, force: bool = False) -> dict[str, PendingChange]:
+        """Remove and return changes which are settled, or all if `force` is set."""
+        now = self.clock()
+        with self.lock:
+            ready = {
+                id: change
+                for id, change in self.pending.items()
+                if force or now - change.last_event >= self.debounce
+            }
+            for id in ready:
+                del self.pending[id]
+        return ready
+
+    def restore(self, changes: dict[str, PendingChange]) -> None:
+        """Put drained changes back, e.g. if they were not stored."""
+        with self.lock:
+            for id, change in changes.items():
+                pending = self.pending.get(id)
+                if pending is None:
+                    self.pending[id] = change
+                    continue
+                # Merged into events received in the meantime
+                pending.with_blocks = pending.with_blocks or change.with_blocks
+                pending.blocks.update(change.blocks)
+
+    def _verify_signature(self, body: bytes, signature: str | None) -> bool:
+        if self.verification_token is None:
+            return True
+        expected = hmac.new(
+            self.verification_token.encode("utf-8"), body, hashlib.sha256
+        ).hexdigest()
+        return signature is not None and hmac.compare_digest(
+            f"sha256={expected}", signature
+        )
+
+    def _handler_class(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not receiver._verify_signature(
+                    body, self.headers.get("X-Notion-Signature")
+                ):
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+                try:
+                    event = json.loads(body)
+                except json.JSONDecodeError:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                receiver.add_event(event)
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+
+class NotionWebhookProvider(BaseProvider):
+    """Provider which fetches only the objects reported by a webhook receiver.
+
+    Register it under its own name, so its syncs don't advance the sync
+    timestamp of the polling `NotionProvider`, which then still picks up
+    changes missed while the receiver was down. Share the watermarks of the
+    poller with `Bridge(..., shared_watermarks={webhook_name: poller_name})`.
+
+    Drained changes are discarded by `commit_state` once they are stored,
+    changes of a fetch which was not committed are fetched again.
+    """
+
+    def __init__(self, provider: NotionProvider, receiver: NotionWebhookReceiver):
+        self.provider = provider
+        self.receiver = receiver
+        # Changes of the latest fetch, until they are committed
+        self.fetched: dict[str, PendingChange] = {}
+
+        super().__init__()
+
+    def get_latest_data(
+        self, last_sync_timestamp: datetime | None
+    ) -> Tuple[Sequence[NodeEntity], Sequence[EdgeEntity]]:
+        # A previous fetch was not stored (e.g. the sync failed or a dry run)
+        self.receiver.restore(self.fetched)
+        changes = self.fetched = self.receiver.drain()
+        logger.info(f"Fetching {len(changes)} changed objects")
+
+        pages = {}
+        databases = set()
+        blocks = set()
+        for id, change in changes.items():
+            if change.kind == "database":
+                databases.add(id)
+                continue
+            pages[id] = change.with_blocks
+            if not change.with_blocks:
+                blocks.update(change.blocks)
+
+        self.provider.tqdm = self.tqdm
+        self.provider.profiler = self.profiler
+        self.provider.watermarks = self.watermarks
+        self.provider.metrics = self.metrics
+        return self.provider.get_targeted_data(pages, databases, blocks)
+
+    def commit_state(self) -> None:
+        self.fetched = {}
@@ -0,0 +1,264 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import json
+import logging
+import os
+import sqlite3
+from typing import Any, Callable, Iterator, Tuple
+from notion_client import Client
+
+from ..models import BaseNodeEntity, EdgeEntity, NodeEntity
+
+from .base import BaseProvider
+from .notion import NotionProvider, format_datetime, parse_datetime, process_paginated
+
+logger = logging.getLogger(__name__)
+
+
+class ShardQueue:
+    """Durable work queue of crawl shards backed by a local SQLite database.
+
+    Shards move from `pending` to `claimed` to `done`, finished shards keep
+    their crawl results, so an interrupted crawl can be resumed.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS shards ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', result TEXT)"
+        )
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT count(*) FROM shards").fetchone()[0]
+
+    def put(self, shards: list[Tuple[str, str, dict]]) -> None:
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO shards (id, kind, payload) VALUES (?, ?, ?)",
+            [(id, kind, json.dumps(payload)) for id, kind, payload in shards],
+        )
+
+    def claim(self) -> Tuple[str, str, dict] | None:
+        # Lock the database for writes, so two workers never claim the same shard
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.connection.execute(
+                "SELECT id, kind, payload FROM shards WHERE status = 'pending' LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE shards SET status = 'claimed' WHERE id = ?", (row[0],)
+                )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def complete(self, id: str, result: dict) -> None:
+        self.connection.execute(
+            "UPDATE shards SET status = 'done', result = ? WHERE id = ?",
+            (json.dumps(result), id),
+        )
+
+    def release_claimed(self) -> None:
+        self.connection.execute(
+            "UPDATE shards SET status = 'pending' WHERE status = 'claimed'"
+        )
+
+    def results(self) -> Iterator[dict]:
+        cursor = self.connection.execute(
+            "SELECT result FROM shards WHERE status = 'done'"
+        )
+        for (result,) in cursor:
+            yield json.loads(result)
+
+    def clear(self) -> None:
+        self.connection.execute("DELETE FROM shards")
+
+
+def process_object(provider: NotionProvider, kind: str, obj: dict) -> None:
+    if kind == "page":
+        provider._process_page(obj)
+    else:
+        provider._process_database(obj)
+
+
+def crawl_shards(
+    client_factory: Callable[[], Client],
+    queue_path: str,
+    watermarks: dict[str, datetime],
+) -> int:
+    """Worker loop: crawl shards from the queue until it is drained."""
+    queue = ShardQueue(queue_path)
+    client = client_factory()
+    processed = 0
+    while (shard := queue.claim()) is not None:
+        shard_id, kind, payload = shard
+        logger.info(f"Crawling {kind} shard {shard_id}")
+
+        provider = NotionProvider(client)
+        provider.watermarks = dict(watermarks)
+        # Search results nested in the shard are resolved without retrieving
+        # them, like by a single process crawl
+        nested = payload["nested"]
+        provider.prefetched = {obj["id"]: obj for _, obj in nested}
+        process_object(provider, kind, payload["object"])
+        # Nested results not reached from the root, e.g. below an unchanged page
+        for nested_kind, obj in nested:
+            if provider.prefetched.pop(obj["id"], None) is not None:
+                process_object(provider, nested_kind, obj)
+        provider._process_deferred()
+
+        queue.complete(
+            shard_id,
+            {
+                "nodes": [
+                    node.model_dump(mode="json") for node in provider.state.nodes()
+                ],
+                "edges": list(provider.state.edge_ids()),
+                "references": provider.state.referenced_types(),
+                "watermarks": {
+                    container: format_datetime(timestamp)
+                    for container, timestamp in provider.watermarks.items()
+                },
+            },
+        )
+        processed += 1
+    return processed
+
+
+class ShardedNotionProvider(BaseProvider):
+    """Crawls a Notion workspace with a pool of worker processes.
+
+    The workspace is partitioned into shards rooted at the top-level pages and
+    databases returned by `search`. Shards are handed to workers through a
+    `ShardQueue` at `queue_path`, and the results are merged with cross-shard
+    deduplication. If a previous crawl was interrupted, its remaining shards
+    are resumed instead of starting a new search.
+
+    `client_factory` is called in every worker process, so it has to be
+    picklable, e.g. `functools.partial(Client, auth=token)`.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Client],
+        queue_path: str,
+        processes: int | None = None,
+    ):
+        self.client_factory = client_factory
+        self.queue_path = queue_path
+        self.processes = processes or os.cpu_count() or 1
+
+        super().__init__()
+
+    def get_latest_data(
+        self, last_sync_timestamp: datetime | None
+    ) -> Tuple[list[NodeEntity], list[EdgeEntity]]:
+        queue = ShardQueue(self.queue_path)
+        queue.release_claimed()
+        if len(queue) == 0:
+            self._enqueue_shards(queue, last_sync_timestamp)
+        else:
+            logger.info(f"Resuming interrupted crawl from {self.queue_path}")
+
+        with ProcessPoolExecutor(self.processes) as executor:
+            futures = [
+                executor.submit(
+                    crawl_shards, self.client_factory, self.queue_path, self.watermarks
+                )
+                for _ in range(self.processes)
+            ]
+            processed = sum(future.result() for future in futures)
+        logger.info(f"Crawled {processed} shards with {self.processes} processes")
+
+        result = self._merge(queue)
+        queue.clear()
+        return result
+
+    def _enqueue_shards(
+        self, queue: ShardQueue, last_sync_timestamp: datetime | None
+    ) -> None:
+        client = self.client_factory()
+        objects: dict[str, Tuple[str, dict[str, Any]]] = {}
+        for kind in ("page", "database"):
+            results = process_paginated(
+                client.search,
+                last_edited_time=last_sync_timestamp,
+                query="",
+                filter={"value": kind, "property": "object"},
+            )
+            for obj in self.tqdm(results, desc=f"Partitioning {kind}s"):
+                objects[obj["id"]] = (kind, obj)
+
+        # Objects nested in other search results are crawled by their root
+        # shard, which gets their search payload
+        shards: dict[str, dict[str, Any]] = {}
+        nested = []
+        for id, (kind, obj) in objects.items():
+            root = self._shard_root(id, objects)
+            if root == id:
+                shards.setdefault(id, {"nested": []})["object"] = obj
+            else:
+                nested.append((root, kind, obj))
+        for root, kind, obj in nested:
+            shards.setdefault(root, {"nested": []})["nested"].append((kind, obj))
+        logger.info(f"Partitioned {len(objects)} objects into {len(shards)} shards")
+        queue.put([(id, objects[id][0], payload) for id, payload in shards.items()])
+
+    @staticmethod
+    def _shard_root(id: str, objects: dict[str, Tuple[str, dict[str, Any]]]) -> str:
+        visited = {id}
+        while True:
+            parent = objects[id][1]["parent"]
+            if parent["type"] == "workspace":
+                return id
+            parent_id = parent[parent["type"]]
+            if parent_id not in objects or parent_id in visited:
+                return id
+            visited.add(parent_id)
+            id = parent_id
+
+    def _merge(self, queue: ShardQueue) -> Tuple[list[NodeEntity], list[EdgeEntity]]:
+        nodes: dict[str, NodeEntity] = {}
+        edges: set[Tuple[str, str, str]] = set()
+        # Node types of referenced pages and databases, which may be not crawled
+        references: dict[str, str] = {}
+        for result in queue.results():
+            for node in result["nodes"]:
+                if node["id"] not in nodes:
+                    nodes[node["id"]] = NodeEntity.model_validate(node)
+            edges.update(tuple(edge) for edge in result["edges"])
+            references.update(result.get("references", {}))
+            for container, timestamp in result["watermarks"].items():
+                self._advance_watermark(container, parse_datetime(timestamp))
+
+        def endpoint(id: str) -> BaseNodeEntity | None:
+            if id in nodes:
+                return nodes[id]
+            if id in references:
+                return BaseNodeEntity(id=id, type=references[id])
+            return None
+
+        edge_entities = []
+        with self.profiler.stage("transform"):
+            for source_id, target_id, type in edges:
+                source, target = endpoint(source_id), endpoint(target_id)
+                if source is None or target is None:
+                    logger.info(
+                        f"Skipping {type} edge to not crawled {source_id}->{target_id}"
+                    )
+                    continue
+                edge_entities.append(
+                    EdgeEntity(source=source, target=target, type=type)
+                )
+        return list(nodes.values()), edge_entities
+
+    def _advance_watermark(self, container_id: str, timestamp: datetime) -> None:
+        watermark = self.watermarks.get(container_id)
+        if watermark is None or timestamp > watermark:
+            self.watermarks[container_id] = timestamp
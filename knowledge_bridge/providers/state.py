@@ -0,0 +1,273 @@
+import itertools
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+from typing import Iterator, Sequence, Tuple, overload
+import uuid
+
+from ..models import BaseNodeEntity, EdgeEntity, NodeEntity
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Rough size of a NodeEntity without its text and link
+NODE_OVERHEAD = 1024
+
+CompactId = bytes | str
+CompactEdge = Tuple[CompactId, CompactId, str]
+
+
+def compact_id(id: str) -> CompactId:
+    """Store canonical UUIDs as 16 bytes, other ids are kept as is."""
+    try:
+        value = uuid.UUID(id)
+    except ValueError:
+        return id
+    if str(value) != id:
+        return id
+    return value.bytes
+
+
+def expand_id(id: CompactId) -> str:
+    if isinstance(id, bytes):
+        return str(uuid.UUID(bytes=id))
+    return id
+
+
+def peak_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class SpilledNodes(Sequence[NodeEntity]):
+    """Lazy sequence of nodes spilled to disk followed by resident nodes."""
+
+    def __init__(self, state: "CrawlState"):
+        self.state = state
+
+    def __len__(self) -> int:
+        return self.state.spilled + len(self.state.resident)
+
+    def __iter__(self) -> Iterator[NodeEntity]:
+        yield from self.state._iter_spilled()
+        yield from self.state.resident.values()
+
+    @overload
+    def __getitem__(self, index: int) -> NodeEntity: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[NodeEntity]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            return self._read_range(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if index < self.state.spilled:
+            return self.state._read_spilled(index)
+        return list(self.state.resident.values())[index - self.state.spilled]
+
+    def _read_range(self, start: int, stop: int) -> list[NodeEntity]:
+        spilled = self.state.spilled
+        nodes: list[NodeEntity] = []
+        if start < spilled:
+            nodes.extend(self.state._read_spilled_range(start, min(stop, spilled)))
+        if stop > spilled:
+            nodes.extend(
+                itertools.islice(
+                    self.state.resident.values(),
+                    max(start - spilled, 0),
+                    stop - spilled,
+                )
+            )
+        return nodes
+
+
+class CrawlEdges(Sequence[EdgeEntity]):
+    """Lazy sequence of edges built from the compact edges of a crawl."""
+
+    def __init__(self, state: "CrawlState", edges: list[CompactEdge]):
+        self.state = state
+        self.edges = edges
+
+    def __len__(self) -> int:
+        return len(self.edges)
+
+    def __iter__(self) -> Iterator[EdgeEntity]:
+        for edge in self.edges:
+            yield self.state._edge_entity(edge)
+
+    @overload
+    def __getitem__(self, index: int) -> EdgeEntity: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[EdgeEntity]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.state._edge_entity(edge) for edge in self.edges[index]]
+        return self.state._edge_entity(self.edges[index])
+
+
+class CrawlState:
+    """Nodes and edges collected by a crawl, kept within a memory budget.
+
+    Seen ids are kept as compact UUID bytes. Once the estimated size of
+    resident nodes exceeds `memory_budget` bytes, they are spilled to a
+    temporary SQLite database in `spill_dir`.
+    """
+
+    def __init__(self, memory_budget: int | None = None, spill_dir: str | None = None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        # Node type by compact id, also used as the set of seen ids
+        self.types: dict[CompactId, str] = {}
+        self.edges: set[CompactEdge] = set()
+        # Node type of referenced ids, which may be not crawled
+        self.hints: dict[CompactId, str] = {}
+        self.resident: dict[str, NodeEntity] = {}
+        self.resident_bytes = 0
+        self.spilled = 0
+        self._connection: sqlite3.Connection | None = None
+        self._spill_path: str | None = None
+
+    def __contains__(self, id: str) -> bool:
+        return compact_id(id) in self.types
+
+    def __del__(self) -> None:
+        self.close()
+
+    def add_node(self, node: NodeEntity) -> None:
+        self.types[compact_id(node.id)] = sys.intern(node.type)
+        self.resident[node.id] = node
+        self.resident_bytes += (
+            len(node.text or "") + len(node.link or "") + NODE_OVERHEAD
+        )
+        if self.memory_budget is not None and self.resident_bytes > self.memory_budget:
+            self._spill()
+
+    def add_edge(
+        self,
+        source: str,
+        target: str,
+        type: str,
+        target_type: str | None = None,
+        source_type: str | None = None,
+    ) -> None:
+        """Add an edge, endpoint types allow it to connect not crawled nodes."""
+        source_id, target_id = compact_id(source), compact_id(target)
+        self.edges.add((source_id, target_id, sys.intern(type)))
+        if source_type is not None:
+            self.hints[source_id] = sys.intern(source_type)
+        if target_type is not None:
+            self.hints[target_id] = sys.intern(target_type)
+
+    def type_of(self, id: CompactId) -> str | None:
+        return self.types.get(id) or self.hints.get(id)
+
+    def nodes(self) -> Sequence[NodeEntity]:
+        if self.spilled == 0:
+            return list(self.resident.values())
+        return SpilledNodes(self)
+
+    def edge_ids(self) -> Iterator[Tuple[str, str, str]]:
+        for source, target, type in self.edges:
+            yield expand_id(source), expand_id(target), type
+
+    def referenced_types(self) -> dict[str, str]:
+        return {expand_id(id): type for id, type in self.hints.items()}
+
+    def edge_entities(self) -> Sequence[EdgeEntity]:
+        """Edges between typed nodes, built one by one when they are read."""
+        edges = []
+        for edge in self.edges:
+            source, target, type = edge
+            if self.type_of(source) is None or self.type_of(target) is None:
+                logger.info(
+                    f"Skipping {type} edge to not crawled {expand_id(source)}->{expand_id(target)}"
+                )
+                continue
+            edges.append(edge)
+        return CrawlEdges(self, edges)
+
+    def _edge_entity(self, edge: CompactEdge) -> EdgeEntity:
+        source, target, type = edge
+        return EdgeEntity(
+            source=BaseNodeEntity(id=expand_id(source), type=self._known_type(source)),
+            target=BaseNodeEntity(id=expand_id(target), type=self._known_type(target)),
+            type=type,
+        )
+
+    def _known_type(self, id: CompactId) -> str:
+        return self.types.get(id) or self.hints[id]
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._spill_path is not None:
+            os.remove(self._spill_path)
+            self._spill_path = None
+
+    def _spill(self) -> None:
+        if self._connection is None:
+            fd, self._spill_path = tempfile.mkstemp(
+                prefix="crawl-", suffix=".sqlite", dir=self.spill_dir
+            )
+            os.close(fd)
+            self._connection = sqlite3.connect(self._spill_path)
+            self._connection.execute(
+                "CREATE TABLE nodes (seq INTEGER PRIMARY KEY, data TEXT NOT NULL)"
+            )
+
+        logger.info(
+            f"Spilling {len(self.resident)} nodes ({self.resident_bytes} bytes) to {self._spill_path}"
+        )
+        self._connection.executemany(
+            "INSERT INTO nodes (seq, data) VALUES (?, ?)",
+            (
+                (self.spilled + index, node.model_dump_json())
+                for index, node in enumerate(self.resident.values())
+            ),
+        )
+        self._connection.commit()
+        self.spilled += len(self.resident)
+        self.resident = {}
+        self.resident_bytes = 0
+
+    def _iter_spilled(self) -> Iterator[NodeEntity]:
+        if self._connection is None:
+            return
+        cursor = self._connection.execute("SELECT data FROM nodes ORDER BY seq")
+        for (data,) in cursor:
+            yield NodeEntity.model_validate_json(data)
+
+    def _read_spilled_range(self, start: int, stop: int) -> Iterator[NodeEntity]:
+        assert self._connection is not None
+        cursor = self._connection.execute(
+            "SELECT data FROM nodes WHERE seq >= ? AND seq < ? ORDER BY seq",
+            (start, stop),
+        )
+        for (data,) in cursor:
+            yield NodeEntity.model_validate_json(data)
+
+    def _read_spilled(self, index: int) -> NodeEntity:
+        assert self._connection is not None
+        (data,) = self._connection.execute(
+            "SELECT data FROM nodes WHERE seq = ?", (index,)
+        ).fetchone()
+        return NodeEntity.model_validate_json(data)
@@ -1,16 +1,74 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
+from typing import Iterable, Sequence
 
-from knowledge_bridge.models import EdgeEntity, NodeEntity
+from knowledge_bridge.models import BaseNodeEntity, EdgeEntity, NodeEntity
+from knowledge_bridge.profiling import NULL_PROFILER, BaseProfiler
 
 
 class BaseGraphStorage(ABC):
+    # Profiler of sync stages, set by the bridge when profiling is on
+    profiler: BaseProfiler = NULL_PROFILER
+
     @abstractmethod
     def get_last_sync_timestamp(self, provider: str) -> datetime | None:
         raise NotImplementedError
 
     @abstractmethod
     def incremental_data_sync(
-        self, provider: str, nodes: list[NodeEntity], edges: list[EdgeEntity]
+        self,
+        provider: str,
+        nodes: Sequence[NodeEntity],
+        edges: Sequence[EdgeEntity],
     ) -> None:
         raise NotImplementedError
+
+    @abstractmethod
+    def get_watermarks(self, provider: str) -> dict[str, datetime]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_watermarks(self, provider: str, watermarks: dict[str, datetime]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_node_fingerprints(
+        self, nodes: Sequence[BaseNodeEntity]
+    ) -> dict[str, tuple[str | None, bool]]:
+        """Return stored fingerprint and obsolete flag of existing nodes by id."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_existing_edges(
+        self, edges: Sequence[EdgeEntity]
+    ) -> set[tuple[str, str, str]]:
+        """Return (source id, target id, type) of edges which are already stored."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_stale_edges(
+        self,
+        nodes: Iterable[BaseNodeEntity],
+        edges: Iterable[EdgeEntity],
+        types: Sequence[str],
+    ) -> int:
+        """Delete edges of `types` from `nodes` which are not in `edges`.
+
+        Return the number of deleted edges.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def estimate_transactions(self, nodes: int, edges: int) -> int:
+        """Estimate number of transactions incremental_data_sync would run."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_stale_edges(
+        self,
+        nodes: Iterable[BaseNodeEntity],
+        edges: Iterable[EdgeEntity],
+        types: Sequence[str],
+    ) -> int:
+        """Return the number of edges `delete_stale_edges` would delete."""
+        raise NotImplementedError
@@ -0,0 +1,132 @@
+import logging
+import time
+from typing import Callable, Generic, Iterable, Sequence, TypeVar
+from neo4j.exceptions import Neo4jError, TransientError
+
+from .scheduling import retry_delay
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Parts of Neo4j error codes which mean that a transaction was too big, e.g.
+# Neo.TransientError.General.TransactionMemoryLimit or
+# Neo.ClientError.Transaction.TransactionTimedOut
+BATCH_TOO_LARGE_CODES = ("MemoryLimit", "OutOfMemory", "TimedOut")
+
+
+def is_batch_too_large(error: Neo4jError) -> bool:
+    code = error.code or ""
+    return any(part in code for part in BATCH_TOO_LARGE_CODES)
+
+
+class AdaptiveBatcher(Generic[T]):
+    """Splits writes into transactions sized by row count and payload bytes.
+
+    Batches grow while a commit takes less than `target_latency` seconds and
+    shrink when it takes longer. A batch rejected by the server for memory
+    limits or timeouts is split in half and retried, deadlocks and other
+    transient errors are retried at the same size with an exponential
+    backoff. The learned sizes are kept between runs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_rows: int = 1000,
+        min_rows: int = 1,
+        max_rows: int = 100_000,
+        max_bytes: int = 16 * 1024 * 1024,
+        target_latency: float = 1.0,
+        max_retries: int = 5,
+        backoff: float = 0.1,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.name = name
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.clock = clock
+        self.rows = initial_rows
+        self.bytes = max_bytes
+
+    def run(
+        self,
+        items: Iterable[T],
+        size_of: Callable[[T], int],
+        write: Callable[[Sequence[T]], None],
+    ) -> int:
+        """Write all items, return the number of transactions committed."""
+        transactions = 0
+        iterator = iter(items)
+        exhausted = False
+        # Items which are read, but not written yet
+        pending: list[T] = []
+        # Transient errors of the current batch
+        attempt = 0
+        while True:
+            while not exhausted and len(pending) < self.rows:
+                item = next(iterator, None)
+                if item is None:
+                    exhausted = True
+                else:
+                    pending.append(item)
+            if not pending:
+                break
+
+            batch, batch_bytes = self._take(pending, size_of)
+            begin = self.clock()
+            try:
+                write(batch)
+            except Neo4jError as e:
+                if is_batch_too_large(e) and len(batch) > self.min_rows:
+                    self.rows = max(self.min_rows, len(batch) // 2)
+                    self.bytes = max(1, batch_bytes // 2)
+                    logger.warning(
+                        f"{self.name} batch of {len(batch)} rows / {batch_bytes} bytes was rejected ({e.code}), retrying with {self.rows} rows"
+                    )
+                    continue
+                if isinstance(e, TransientError) and attempt < self.max_retries:
+                    delay = retry_delay(self.backoff, attempt)
+                    logger.warning(
+                        f"Transient error writing {self.name} batch of {len(batch)} rows, retrying in {delay:.2f}s: {e.code}"
+                    )
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                raise
+            latency = self.clock() - begin
+            attempt = 0
+            del pending[: len(batch)]
+            transactions += 1
+            self._adapt(len(batch), latency, last=exhausted and not pending)
+
+        logger.info(
+            f"{self.name} batches settled at {self.rows} rows / {self.bytes} bytes"
+        )
+        return transactions
+
+    def _take(
+        self, pending: list[T], size_of: Callable[[T], int]
+    ) -> tuple[list[T], int]:
+        end = 0
+        batch_bytes = 0
+        while end < len(pending) and end < self.rows:
+            item_bytes = size_of(pending[end])
+            # A batch has at least one item, even if it's bigger than the limit
+            if end > 0 and batch_bytes + item_bytes > self.bytes:
+                break
+            batch_bytes += item_bytes
+            end += 1
+        return pending[:end], batch_bytes
+
+    def _adapt(self, rows: int, latency: float, last: bool) -> None:
+        if latency > self.target_latency:
+            self.rows = max(self.min_rows, rows // 2)
+        elif latency < self.target_latency / 2 and not last:
+            # The last batch is limited by the end of items, not by the sizes
+            self.rows = min(self.max_rows, self.rows * 2)
+            self.bytes = min(self.max_bytes, self.bytes * 2)
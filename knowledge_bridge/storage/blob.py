@@ -0,0 +1,99 @@
+from abc import ABC, abstractmethod
+import hashlib
+import os
+import sqlite3
+import tempfile
+import zlib
+
+
+class BaseBlobStore(ABC):
+    """Content-addressed store for large node texts.
+
+    Texts are keyed by their sha256 hash, so identical content is stored once.
+    """
+
+    @staticmethod
+    def hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def put(self, text: str) -> str:
+        key = self.hash(text)
+        if not self.contains(key):
+            self._write(key, zlib.compress(text.encode("utf-8")))
+        return key
+
+    def get(self, key: str) -> str:
+        return zlib.decompress(self._read(key)).decode("utf-8")
+
+    @abstractmethod
+    def contains(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _read(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _write(self, key: str, data: bytes) -> None:
+        raise NotImplementedError
+
+
+class FileSystemBlobStore(BaseBlobStore):
+    """Stores every blob as a zlib-compressed file under `root`."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        # Fan out into subdirectories to keep directory listings small
+        return os.path.join(self.root, key[:2], key[2:])
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def _read(self, key: str) -> bytes:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first, so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class SQLiteBlobStore(BaseBlobStore):
+    """Stores blobs as zlib-compressed rows of a single SQLite table."""
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, data BLOB NOT NULL)"
+        )
+        self.connection.commit()
+
+    def contains(self, key: str) -> bool:
+        cursor = self.connection.execute("SELECT 1 FROM blobs WHERE hash = ?", (key,))
+        return cursor.fetchone() is not None
+
+    def _read(self, key: str) -> bytes:
+        cursor = self.connection.execute(
+            "SELECT data FROM blobs WHERE hash = ?", (key,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def _write(self, key: str, data: bytes) -> None:
+        self.connection.execute(
+            "INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)", (key, data)
+        )
+        self.connection.commit()
@@ -1,18 +1,49 @@
+from collections import defaultdict
 from contextlib import contextmanager
 from datetime import datetime
+import math
 import os
-from typing import Generator
+from typing import Generator, Iterable, Iterator, Sequence
 import uuid
-from neo4j import GraphDatabase, Record, Session
+from neo4j import Driver, GraphDatabase, Record, Session
 
-from ..models import BaseNodeEntity, NodeEntity, EdgeEntity
+from ..models import CONTENT_EDGE_TYPES, BaseNodeEntity, NodeEntity, EdgeEntity
 
 from .base import BaseGraphStorage
+from .batching import AdaptiveBatcher
+from .blob import BaseBlobStore
+from .scheduling import (
+    Neo4jWriteScheduler,
+    chunked,
+    partition_edges,
+    partition_nodes,
+)
 
 
 class Neo4jGraphStorage(BaseGraphStorage):
-    def __init__(self, session: Session):
+    def __init__(
+        self,
+        session: Session,
+        blob_store: BaseBlobStore | None = None,
+        blob_threshold: int = 4096,
+        write_scheduler: Neo4jWriteScheduler | None = None,
+        node_batcher: AdaptiveBatcher[NodeEntity] | None = None,
+        edge_batcher: AdaptiveBatcher[EdgeEntity] | None = None,
+        write_chunk_size: int = 10000,
+    ):
         self.session = session
+        # Optional store for texts longer than blob_threshold characters
+        self.blob_store = blob_store
+        self.blob_threshold = blob_threshold
+        # Optional scheduler for parallel node and edge writes
+        self.write_scheduler = write_scheduler
+        # Optional batchers which split serial writes into adaptively sized
+        # transactions, ignored if the write scheduler is set
+        self.node_batcher = node_batcher
+        self.edge_batcher = edge_batcher
+        # Rows per transaction of serial writes without a batcher, nodes are
+        # streamed in chunks, so a spilled crawl is not loaded back at once
+        self.write_chunk_size = write_chunk_size
 
     def get_last_sync_timestamp(self, provider: str) -> datetime | None:
         query = (
@@ -28,28 +59,298 @@ class Neo4jGraphStorage(BaseGraphStorage):
         else:
             return None
 
+    def get_watermarks(self, provider: str) -> dict[str, datetime]:
+        query = (
+            "MATCH (n:Watermark {provider: $provider}) "
+            "RETURN n.container AS container, n.timestamp AS timestamp"
+        )
+        result = self.session.run(query, provider=provider)
+        return {
+            record["container"]: record["timestamp"].to_native().replace(tzinfo=None)
+            for record in result
+        }
+
+    def set_watermarks(self, provider: str, watermarks: dict[str, datetime]) -> None:
+        self.session.write_transaction(self._batch_set_watermarks, provider, watermarks)
+
     def incremental_data_sync(
-        self, provider: str, nodes: list[NodeEntity], edges: list[EdgeEntity]
+        self,
+        provider: str,
+        nodes: Sequence[NodeEntity],
+        edges: Sequence[EdgeEntity],
     ) -> None:
         # Upsert new nodes and edges
-        self.session.write_transaction(self._batch_create_or_update_nodes, nodes)
-        self.session.write_transaction(self._batch_create_or_update_edges, edges)
+        with self.profiler.stage("write_nodes"):
+            self._write_nodes(self._offload_texts(nodes))
+        with self.profiler.stage("write_edges"):
+            self._write_edges(edges)
+            # References and headings removed from re-crawled nodes
+            self.delete_stale_edges(nodes, edges, CONTENT_EDGE_TYPES)
+
+        with self.profiler.stage("write_sync_metadata"):
+            # Create sync metadata node
+            sync_metadata = self.session.write_transaction(
+                self._create_sync_metadata, provider
+            )
+
+            # Create edges between upgrade metadata and new nodes, endpoints
+            # are only ids and types, so node texts are not kept alive
+            sync_metadata_node = BaseNodeEntity(id=sync_metadata["id"], type="Sync")
+            sync_metadata_edges = (
+                EdgeEntity(
+                    source=sync_metadata_node,
+                    target=BaseNodeEntity(id=node.id, type=node.type),
+                    type="SYNC",
+                )
+                for node in nodes
+            )
+            self._write_edges(sync_metadata_edges)
+
+    def _write_nodes(self, nodes: Iterable[NodeEntity]) -> None:
+        if self.write_scheduler is not None:
+            self.write_scheduler.run_partitioned(
+                self._batch_create_or_update_nodes,
+                partition_nodes(
+                    nodes,
+                    self.write_scheduler.chunk_size,
+                    self.write_scheduler.max_workers,
+                ),
+            )
+        elif self.node_batcher is not None:
+            self.node_batcher.run(
+                nodes,
+                self._node_size,
+                lambda batch: self._write_transaction(
+                    self._batch_create_or_update_nodes, batch
+                ),
+            )
+        else:
+            for chunk in chunked(nodes, self.write_chunk_size):
+                self.session.write_transaction(
+                    self._batch_create_or_update_nodes, chunk
+                )
+
+    def _write_edges(self, edges: Iterable[EdgeEntity]) -> None:
+        if self.write_scheduler is not None:
+            self.write_scheduler.run_partitioned(
+                self._batch_create_or_update_edges,
+                partition_edges(
+                    edges,
+                    self.write_scheduler.chunk_size,
+                    self.write_scheduler.max_workers,
+                ),
+            )
+        elif self.edge_batcher is not None:
+            self.edge_batcher.run(
+                edges,
+                self._edge_size,
+                lambda batch: self._write_transaction(
+                    self._batch_create_or_update_edges, batch
+                ),
+            )
+        else:
+            for chunk in chunked(edges, self.write_chunk_size):
+                self.session.write_transaction(
+                    self._batch_create_or_update_edges, chunk
+                )
+
+    def _write_transaction(self, work, items: Sequence) -> None:
+        # Unlike write_transaction, an explicit transaction is not retried by
+        # the driver, so a batch over the memory limit fails fast and the
+        # batcher can split it
+        with self.session.begin_transaction() as tx:
+            work(tx, items)
+            tx.commit()
+
+    @staticmethod
+    def _node_size(node: NodeEntity) -> int:
+        # Rough payload size of a node row, properties other than text, link
+        # and id are small and fixed
+        return len(node.text or "") + len(node.link or "") + len(node.id) + 200
+
+    @staticmethod
+    def _edge_size(edge: EdgeEntity) -> int:
+        return len(edge.source.id) + len(edge.target.id) + len(edge.type) + 50
+
+    def get_node_fingerprints(
+        self, nodes: Sequence[BaseNodeEntity]
+    ) -> dict[str, tuple[str | None, bool]]:
+        ids_by_type: dict[str, list[str]] = defaultdict(list)
+        for node in nodes:
+            ids_by_type[node.type].append(node.id)
 
-        # Create sync metadata node
-        sync_metadata = self.session.write_transaction(
-            self._create_sync_metadata, provider
+        fingerprints = {}
+        for type, ids in ids_by_type.items():
+            query = (
+                "UNWIND $ids AS id "
+                f"MATCH (n:{type} {{id: id}}) "
+                "RETURN n.id AS id, n.fingerprint AS fingerprint, n.obsolete AS obsolete"
+            )
+            for record in self.session.run(query, ids=ids):
+                fingerprints[record["id"]] = (
+                    record["fingerprint"],
+                    bool(record["obsolete"]),
+                )
+        return fingerprints
+
+    def get_existing_edges(
+        self, edges: Sequence[EdgeEntity]
+    ) -> set[tuple[str, str, str]]:
+        rows_by_types: dict[tuple[str, str, str], list[dict]] = defaultdict(list)
+        for edge in edges:
+            rows_by_types[(edge.source.type, edge.target.type, edge.type)].append(
+                {"sourceId": edge.source.id, "targetId": edge.target.id}
+            )
+
+        existing = set()
+        for (source_type, target_type, type), rows in rows_by_types.items():
+            query = (
+                "UNWIND $rows AS row "
+                f"MATCH (:{source_type} {{id: row.sourceId}})-[:{type}]->"
+                f"(:{target_type} {{id: row.targetId}}) "
+                "RETURN DISTINCT row.sourceId AS sourceId, row.targetId AS targetId"
+            )
+            for record in self.session.run(query, rows=rows):
+                existing.add((record["sourceId"], record["targetId"], type))
+        return existing
+
+    def delete_stale_edges(
+        self,
+        nodes: Iterable[BaseNodeEntity],
+        edges: Iterable[EdgeEntity],
+        types: Sequence[str],
+    ) -> int:
+        kept = self._kept_edges(edges, types)
+        deleted = 0
+        for chunk in chunked(nodes, self.write_chunk_size):
+            deleted += self.session.write_transaction(
+                self._batch_stale_edges, chunk, kept, list(types), True
+            )
+        return deleted
+
+    def count_stale_edges(
+        self,
+        nodes: Iterable[BaseNodeEntity],
+        edges: Iterable[EdgeEntity],
+        types: Sequence[str],
+    ) -> int:
+        kept = self._kept_edges(edges, types)
+        return sum(
+            self._batch_stale_edges(self.session, chunk, kept, list(types), False)
+            for chunk in chunked(nodes, self.write_chunk_size)
         )
 
-        # Create edges between upgrade metadata and new nodes
-        sync_metadata_node = BaseNodeEntity(id=sync_metadata["id"], type="Sync")
-        sync_metadata_edges = [
-            EdgeEntity(source=sync_metadata_node, target=node, type="SYNC")
-            for node in nodes
-        ]
-        self.session.write_transaction(
-            self._batch_create_or_update_edges, sync_metadata_edges
+    @staticmethod
+    def _kept_edges(
+        edges: Iterable[EdgeEntity], types: Sequence[str]
+    ) -> dict[str, list[list[str]]]:
+        kept: dict[str, list[list[str]]] = defaultdict(list)
+        for edge in edges:
+            if edge.type in types:
+                kept[edge.source.id].append([edge.target.id, edge.type])
+        return kept
+
+    def estimate_transactions(self, nodes: int, edges: int) -> int:
+        # Nodes, edges, stale edge deletes, sync metadata node, sync metadata
+        # edges and watermarks
+        return (
+            self._estimate_write_transactions(nodes, self.node_batcher)
+            + self._estimate_write_transactions(edges, self.edge_batcher)
+            + math.ceil(nodes / self.write_chunk_size)
+            + 1
+            + self._estimate_write_transactions(nodes, self.edge_batcher)
+            + 1
         )
 
+    def _estimate_write_transactions(
+        self, rows: int, batcher: AdaptiveBatcher | None = None
+    ) -> int:
+        if self.write_scheduler is not None:
+            return math.ceil(rows / self.write_scheduler.chunk_size)
+        if batcher is not None:
+            # Based on the batch size learned by previous writes
+            return max(1, math.ceil(rows / batcher.rows))
+        return max(1, math.ceil(rows / self.write_chunk_size))
+
+    def get_node_text(self, node: BaseNodeEntity) -> str | None:
+        # Matched by label, so the lookup can use the index on id
+        query = (
+            f"MATCH (n:{node.type} {{id: $id}}) "
+            "RETURN n.text AS text, n.text_hash AS text_hash "
+            "LIMIT 1"
+        )
+        record = self.session.run(query, id=node.id).single()
+        if record is None:
+            raise KeyError(node.id)
+        if record["text"] is None and record["text_hash"] is not None:
+            if self.blob_store is None:
+                raise ValueError(
+                    f"Text of node {node.id} is offloaded, but blob store is not configured"
+                )
+            return self.blob_store.get(record["text_hash"])
+        return record["text"]
+
+    def _offload_texts(self, nodes: Iterable[NodeEntity]) -> Iterator[NodeEntity]:
+        for node in nodes:
+            if (
+                self.blob_store is not None
+                and node.text is not None
+                and len(node.text) > self.blob_threshold
+            ):
+                node = node.model_copy(
+                    update={
+                        "text": None,
+                        "text_hash": self.blob_store.put(node.text),
+                        "text_length": len(node.text),
+                    }
+                )
+            yield node
+
+    @staticmethod
+    def _batch_set_watermarks(
+        tx, provider: str, watermarks: dict[str, datetime]
+    ) -> None:
+        query = (
+            "UNWIND $watermarks AS watermark "
+            "MERGE (n:Watermark {provider: $provider, container: watermark.container}) "
+            "SET n.timestamp = watermark.timestamp"
+        )
+        tx.run(
+            query,
+            provider=provider,
+            watermarks=[
+                {"container": container, "timestamp": timestamp}
+                for container, timestamp in watermarks.items()
+            ],
+        )
+
+    @staticmethod
+    def _batch_stale_edges(
+        tx,
+        nodes: Sequence[BaseNodeEntity],
+        kept: dict[str, list[list[str]]],
+        types: list[str],
+        delete: bool,
+    ) -> int:
+        # Labels can't be parametrised, so edges are matched per source type
+        rows_by_type: dict[str, list[dict]] = defaultdict(list)
+        for node in nodes:
+            rows_by_type[node.type].append(
+                {"id": node.id, "kept": kept.get(node.id, [])}
+            )
+
+        count = 0
+        for type, rows in rows_by_type.items():
+            query = (
+                "UNWIND $rows AS row "
+                f"MATCH (:{type} {{id: row.id}})-[r]->(target) "
+                "WHERE type(r) IN $types AND NOT [target.id, type(r)] IN row.kept "
+                + ("DELETE r " if delete else "")
+                + "RETURN count(r) AS count"
+            )
+            count += tx.run(query, rows=rows, types=types).single()["count"]
+        return count
+
     @staticmethod
     def _create_sync_metadata(tx, provider: str) -> Record:
         query = (
@@ -60,57 +361,85 @@ class Neo4jGraphStorage(BaseGraphStorage):
         return result.single()[0]
 
     @staticmethod
-    def _batch_create_or_update_nodes(tx, nodes: list[NodeEntity]) -> list[Record]:
-        results = []
+    def _batch_create_or_update_nodes(tx, nodes: Iterable[NodeEntity]) -> None:
+        # Labels can't be parametrised, so nodes are upserted per type
+        nodes_by_type: dict[str, list[NodeEntity]] = defaultdict(list)
         for node in nodes:
+            nodes_by_type[node.type].append(node)
+
+        for type, typed_nodes in nodes_by_type.items():
             query = (
-                f"MERGE (n:{node.type} {{id: $id}}) "
-                "ON CREATE SET n.created = $created, n.edited = $edited, n.link = $link, n.text = $text, n.obsolete = $obsolete "
-                "ON MATCH SET n.created = $created, n.edited = $edited, n.link = $link, n.text = $text, n.obsolete = $obsolete "
-                "RETURN n"
-            )
-            result = tx.run(
-                query,
-                id=node.id,
-                created=node.created.isoformat(),
-                edited=node.edited.isoformat(),
-                link=node.link,
-                text=node.text,
-                obsolete=node.obsolete,
+                "UNWIND $rows AS row "
+                f"MERGE (n:{type} {{id: row.id}}) "
+                "SET n.created = row.created, n.edited = row.edited, n.link = row.link, n.text = row.text, n.obsolete = row.obsolete, "
+                "n.text_hash = row.text_hash, n.text_length = row.text_length, n.fingerprint = row.fingerprint"
             )
-            results.append(result.peek()[0])
-        return results
+            rows = [
+                {
+                    "id": node.id,
+                    "created": node.created.isoformat(),
+                    "edited": node.edited.isoformat(),
+                    "link": node.link,
+                    "text": node.text,
+                    "obsolete": node.obsolete,
+                    "text_hash": node.text_hash,
+                    "text_length": node.text_length,
+                    "fingerprint": node.fingerprint,
+                }
+                for node in typed_nodes
+            ]
+            # Nothing is returned, so written rows are not sent back
+            tx.run(query, rows=rows).consume()
 
     @staticmethod
-    def _batch_create_or_update_edges(tx, edges: list[EdgeEntity]) -> list[Record]:
-        results = []
+    def _batch_create_or_update_edges(tx, edges: Iterable[EdgeEntity]) -> None:
+        # Labels and relationship types can't be parametrised, so edges are
+        # upserted per combination of those
+        edges_by_types: dict[tuple[str, str, str], list[EdgeEntity]] = defaultdict(list)
         for edge in edges:
+            edges_by_types[(edge.source.type, edge.target.type, edge.type)].append(edge)
+
+        for (source_type, target_type, type), typed_edges in edges_by_types.items():
             query = (
-                f"MATCH (source:{edge.source.type} {{id: $sourceId}}), "
-                f"(target:{edge.target.type} {{id: $targetId}}) "
-                f"MERGE (source)-[r:{edge.type}]->(target) "
-                "RETURN r"
+                "UNWIND $rows AS row "
+                f"MATCH (source:{source_type} {{id: row.sourceId}}), "
+                f"(target:{target_type} {{id: row.targetId}}) "
+                f"MERGE (source)-[r:{type}]->(target)"
             )
-            result = tx.run(query, sourceId=edge.source.id, targetId=edge.target.id)
-            results.append(result.peek()[0])
-        return results
+            rows = [
+                {"sourceId": edge.source.id, "targetId": edge.target.id}
+                for edge in typed_edges
+            ]
+            # Nothing is returned, so written rows are not sent back
+            tx.run(query, rows=rows).consume()
 
 
 @contextmanager
-def get_neo4j_session(
+def get_neo4j_driver(
     uri: str | None = None,
     username: str | None = None,
     password: str | None = None,
-    database: str | None = None,
-) -> Generator[Session, None, None]:
+) -> Generator[Driver, None, None]:
     uri = uri or os.getenv("NEO4J_URI", "neo4j://localhost")
     username = username or os.getenv("NEO4J_USER", "neo4j")
     password = password or os.getenv("NEO4J_PASSWORD", "neo4j")
-    database = database or os.getenv("NEO4J_DATABASE", None)
 
     auth = (username, password)
 
     with GraphDatabase.driver(uri, auth=auth) as driver:  # type: ignore
         driver.verify_connectivity()
+        yield driver
+
+
+@contextmanager
+def get_neo4j_session(
+    uri: str | None = None,
+    username: str | None = None,
+    password: str | None = None,
+    database: str | None = None,
+) -> Generator[Session, None, None]:
+    database = database or os.getenv("NEO4J_DATABASE", None)
+
+    with get_neo4j_driver(uri, username, password) as driver:
         with driver.session(database=database) as session:
             yield session
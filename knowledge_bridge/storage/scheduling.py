@@ -0,0 +1,180 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import logging
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+from neo4j import Driver
+from neo4j.exceptions import TransientError
+
+from ..models import EdgeEntity, NodeEntity
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def retry_delay(backoff: float, attempt: int) -> float:
+    """Exponential backoff with jitter before a retry of a transient error."""
+    return backoff * 2**attempt * (1 + random.random())
+
+
+def chunked(items: Iterable[T], chunk_size: int) -> Iterator[list[T]]:
+    """Split items into chunks, reading them once in order."""
+    iterator = iter(items)
+    while chunk := list(islice(iterator, chunk_size)):
+        yield chunk
+
+
+def partition(
+    items: Iterable[T], key: Callable[[T], str], chunk_size: int, partitions: int
+) -> Iterator[tuple[int, list[T]]]:
+    """Split items into chunks of partitions as they are read.
+
+    Items with the same key always go to the same partition, a chunk is
+    yielded with its partition as soon as it is full, so only one chunk per
+    partition is kept in memory.
+    """
+    buffers: list[list[T]] = [[] for _ in range(partitions)]
+    for item in items:
+        index = hash(key(item)) % partitions
+        buffers[index].append(item)
+        if len(buffers[index]) >= chunk_size:
+            yield index, buffers[index]
+            buffers[index] = []
+    for index, buffer in enumerate(buffers):
+        if buffer:
+            yield index, buffer
+
+
+def partition_nodes(
+    nodes: Iterable[NodeEntity], chunk_size: int, partitions: int
+) -> Iterator[tuple[int, list[NodeEntity]]]:
+    """Split nodes into chunks of partitions with disjoint ids."""
+    return partition(nodes, lambda node: node.id, chunk_size, partitions)
+
+
+def partition_edges(
+    edges: Iterable[EdgeEntity], chunk_size: int, partitions: int
+) -> Iterator[tuple[int, list[EdgeEntity]]]:
+    """Split edges into chunks of partitions, so that all edges of a source
+    node share a partition.
+
+    Edges of a source node with more than `chunk_size` edges (e.g. the Sync
+    node) span several chunks of the same partition.
+    """
+    return partition(edges, lambda edge: edge.source.id, chunk_size, partitions)
+
+
+class Neo4jWriteScheduler:
+    """Runs write chunks in parallel transactions.
+
+    Chunks of different partitions are expected to touch disjoint sets of
+    nodes (see `partition_nodes` and `partition_edges`), so concurrent
+    transactions do not contend for the same locks. Chunks of a partition are
+    written one after another. Deadlocks and other transient errors are
+    retried with an exponential backoff.
+    """
+
+    def __init__(
+        self,
+        driver: Driver,
+        database: str | None = None,
+        max_workers: int = 4,
+        chunk_size: int = 1000,
+        max_retries: int = 5,
+        backoff: float = 0.1,
+    ):
+        self.driver = driver
+        self.database = database
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def run(
+        self, work: Callable[[Any, list[T]], Any], chunks: Iterable[list[T]]
+    ) -> None:
+        self.run_partitioned(
+            work,
+            ((index % self.max_workers, chunk) for index, chunk in enumerate(chunks)),
+        )
+
+    def run_partitioned(
+        self,
+        work: Callable[[Any, list[T]], Any],
+        chunks: Iterable[tuple[int, list[T]]],
+    ) -> None:
+        """Write chunks of a partition one after another, partitions in parallel.
+
+        Chunks are read as they are written, at most two chunks per partition
+        wait for a worker.
+        """
+        if self.max_workers <= 1:
+            for _, chunk in chunks:
+                self._write(work, chunk)
+            return
+
+        queues: list[queue.Queue[list[T] | None]] = [
+            queue.Queue(maxsize=2) for _ in range(self.max_workers)
+        ]
+        failed = threading.Event()
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            futures = [
+                executor.submit(self._write_queued, work, chunk_queue, failed)
+                for chunk_queue in queues
+            ]
+            try:
+                for index, chunk in chunks:
+                    if failed.is_set():
+                        break
+                    queues[index % self.max_workers].put(chunk)
+            finally:
+                for chunk_queue in queues:
+                    chunk_queue.put(None)
+            for future in futures:
+                future.result()
+
+    def _write_queued(
+        self,
+        work: Callable[[Any, list[T]], Any],
+        chunks: queue.Queue[list[T] | None],
+        failed: threading.Event,
+    ) -> None:
+        error: Exception | None = None
+        while (chunk := chunks.get()) is not None:
+            # Chunks queued after a failure are dropped, so the reader is not
+            # blocked on a full queue
+            if error is not None:
+                continue
+            try:
+                self._write(work, chunk)
+            except Exception as e:
+                error = e
+                failed.set()
+        if error is not None:
+            raise error
+
+    def _write(self, work: Callable[[Any, list[T]], Any], chunk: list[T]) -> None:
+        attempt = 0
+        while True:
+            try:
+                # Explicit transaction, so retries are controlled by the scheduler
+                with (
+                    self.driver.session(database=self.database) as session,
+                    session.begin_transaction() as tx,
+                ):
+                    work(tx, chunk)
+                    tx.commit()
+                return
+            except TransientError as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = retry_delay(self.backoff, attempt)
+                logger.warning(
+                    f"Transient error writing chunk of {len(chunk)} rows, retrying in {delay:.2f}s: {e.code}"
+                )
+                time.sleep(delay)
+                attempt += 1
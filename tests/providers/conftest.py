@@ -0,0 +1,179 @@
+import uuid
+from unittest.mock import Mock
+import pytest
+
+
+@pytest.fixture
+def notion_client_mock():
+    page1 = {
+        "id": "page1",
+        "last_edited_time": "2022-01-04T00:00:00.000Z",
+        "created_time": "2022-01-01T00:00:00.000Z",
+        "properties": {},
+        "url": "https://example.com/page1",
+        "in_trash": False,
+        "parent": {
+            "type": "workspace",
+        },
+    }
+    page2 = {
+        "id": "page2",
+        "last_edited_time": "2022-01-05T00:00:00.000Z",
+        "created_time": "2022-01-02T00:00:00.000Z",
+        "properties": {},
+        "url": "https://example.com/page2",
+        "in_trash": True,
+        "parent": {
+            "type": "page",
+            "page": "page1",
+        },
+    }
+    page3 = {
+        "id": "page3",
+        "last_edited_time": "2022-01-01T00:00:00.000Z",
+        "created_time": "2022-01-01T00:00:00.000Z",
+        "properties": {},
+        "url": "https://example.com/page3",
+        "in_trash": True,
+        "parent": {
+            "type": "database",
+            "database": "database1",
+        },
+    }
+    notion_search_page_response = {
+        "results": [page1, page2, page3],
+        "has_more": False,
+    }
+    database1 = {
+        "id": "database1",
+        "last_edited_time": "2022-01-03T00:00:00.000Z",
+        "created_time": "2022-01-01T00:00:00.000Z",
+        "properties": {},
+        "url": "https://example.com/database1",
+        "in_trash": False,
+        "parent": {
+            "type": "page",
+            "page": "page1",
+        },
+    }
+    database2 = {
+        "id": "database2",
+        "last_edited_time": "2022-01-04T00:00:00.000Z",
+        "created_time": "2022-01-02T00:00:00.000Z",
+        "properties": {},
+        "url": "https://example.com/database2",
+        "parent": {"type": "workspace"},
+    }
+    notion_search_database_response = {
+        "results": [database1, database2],
+        "has_more": False,
+    }
+    block1 = {
+        "id": "block1",
+        "type": "paragraph",
+        "paragraph": {"text": [{"type": "text", "text": {"content": "Hello, World!"}}]},
+        "last_edited_time": "2022-01-04T00:00:00.000Z",
+        "created_time": "2022-01-02T00:00:00.000Z",
+        "parent": {
+            "type": "page",
+            "page": "page1",
+        },
+    }
+    block2 = {
+        "id": "page2",
+        "type": "child_page",
+        "last_edited_time": "2022-01-04T00:00:00.000Z",
+        "created_time": "2022-01-02T00:00:00.000Z",
+        "parent": {
+            "type": "page",
+            "page": "page1",
+        },
+    }
+    block3 = {
+        "id": "database1",
+        "type": "child_database",
+        "last_edited_time": "2022-01-04T00:00:00.000Z",
+        "created_time": "2022-01-02T00:00:00.000Z",
+        "parent": {
+            "type": "page",
+            "page": "page1",
+        },
+    }
+    notion_list_block_response = {
+        "results": [block1, block2, block3],
+        "has_more": False,
+    }
+    notion_databases_query_response = {
+        "results": [page3],
+        "has_more": False,
+    }
+
+    def search_method(query, start_cursor=None, filter=None, **kwargs):
+        if filter is None:
+            raise ValueError("Filter is required")
+        if filter["value"] == "page":
+            return notion_search_page_response
+        elif filter["value"] == "database":
+            return notion_search_database_response
+        else:
+            raise ValueError("Invalid filter value")
+
+    mock = Mock()
+    mock.search.side_effect = search_method
+    mock.blocks.children.list.return_value = notion_list_block_response
+    mock.databases.query.return_value = notion_databases_query_response
+    mock.pages.retrieve.return_value = page2
+    mock.databases.retrieve.return_value = database1
+    return mock
+
+
+def make_synthetic_notion_client(
+    pages: int, blocks_per_page: int, text_size: int = 100
+) -> Mock:
+    """Notion client mock for a generated workspace of top-level pages with blocks."""
+    timestamp = "2022-01-01T00:00:00.000Z"
+    page_ids = [str(uuid.UUID(int=index)) for index in range(pages)]
+
+    def page(page_id):
+        return {
+            "id": page_id,
+            "last_edited_time": timestamp,
+            "created_time": timestamp,
+            "properties": {},
+            "url": f"https://example.com/{page_id}",
+            "parent": {"type": "workspace"},
+        }
+
+    def search_method(query, start_cursor=None, filter=None, **kwargs):
+        if filter["value"] == "database":
+            return {"results": [], "has_more": False}
+        return {"results": [page(page_id) for page_id in page_ids], "has_more": False}
+
+    def list_blocks_method(block_id, start_cursor=None, **kwargs):
+        page_index = uuid.UUID(block_id).int
+        results = [
+            {
+                "id": str(uuid.UUID(int=(page_index + 1) << 32 | index)),
+                "type": "paragraph",
+                "paragraph": {
+                    "rich_text": [
+                        {"type": "text", "text": {"content": "x" * text_size}}
+                    ]
+                },
+                "last_edited_time": timestamp,
+                "created_time": timestamp,
+                "parent": {"type": "page", "page": block_id},
+            }
+            for index in range(blocks_per_page)
+        ]
+        return {"results": results, "has_more": False}
+
+    mock = Mock()
+    mock.search.side_effect = search_method
+    mock.blocks.children.list.side_effect = list_blocks_method
+    return mock
+
+
+@pytest.fixture
+def synthetic_notion_client():
+    return make_synthetic_notion_client
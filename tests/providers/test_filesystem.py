@@ -0,0 +1,191 @@
+from datetime import datetime, timedelta
+import os
+import time
+
+import pytest
+
+from knowledge_bridge.providers.filesystem import FileSystemProvider
+
+
+@pytest.fixture
+def vault(tmp_path):
+    root = tmp_path / "vault"
+    (root / "notes").mkdir(parents=True)
+    (root / ".obsidian").mkdir()
+    (root / "index.md").write_text(
+        "# Index\n\nSee [notes](notes/first.md) and [[notes/second]].\n\n"
+        "## Section\n\n### Subsection\n\n## Other section\n"
+    )
+    (root / "notes" / "first.md").write_text("# First\n\n[Back](../index.md)\n")
+    (root / "notes" / "second.md").write_text(
+        "No headings, [web](https://x.org/a.md)\n"
+    )
+    (root / "notes" / "image.png").write_bytes(b"\x89PNG")
+    (root / ".obsidian" / "config.md").write_text("# Hidden\n")
+    return root
+
+
+def edge_tuples(edges):
+    return {(edge.source.id, edge.target.id, edge.type) for edge in edges}
+
+
+def test_get_latest_data(vault, tmp_path):
+    # GIVEN: provider for a vault
+    provider = FileSystemProvider(
+        str(vault), index_path=str(tmp_path / "index.json"), mmap_threshold=64
+    )
+
+    # WHEN: latest data is requested for the first time
+    nodes, edges = provider.get_latest_data(None)
+
+    # THEN: markdown files outside hidden directories and their headings are returned
+    assert {node.id for node in nodes if node.type == "File"} == {
+        "file:index.md",
+        "file:notes/first.md",
+        "file:notes/second.md",
+    }
+    assert sum(node.type == "Heading" for node in nodes) == 5
+
+    # THEN: headings are nested by level and links become edges
+    assert {
+        ("file:index.md", "file:index.md#index", "CHILD_HEADING"),
+        ("file:index.md#index", "file:index.md#section", "CHILD_HEADING"),
+        ("file:index.md#section", "file:index.md#subsection", "CHILD_HEADING"),
+        ("file:index.md#index", "file:index.md#other-section", "CHILD_HEADING"),
+        ("file:index.md", "file:notes/first.md", "LINKS_TO"),
+        ("file:index.md", "file:notes/second.md", "LINKS_TO"),
+        ("file:notes/first.md", "file:index.md", "LINKS_TO"),
+    } <= edge_tuples(edges)
+    assert not any(
+        target.startswith("file:https") for _, target, _ in edge_tuples(edges)
+    )
+
+
+def test_get_latest_data_incremental(vault, tmp_path):
+    # GIVEN: provider which already synced the vault
+    index_path = str(tmp_path / "index.json")
+    synced = FileSystemProvider(str(vault), index_path=index_path)
+    synced_nodes, _ = synced.get_latest_data(None)
+    synced.commit_state()
+    provider = FileSystemProvider(str(vault), index_path=index_path)
+
+    # WHEN: nothing changed
+    # THEN: nothing is returned
+    assert provider.get_latest_data(None) == ([], [])
+
+    # WHEN: one file is touched, one is modified and one is removed
+    time.sleep(0.01)  # So the inode change time moves
+    future = (datetime.now() + timedelta(minutes=1)).timestamp()
+    os.utime(vault / "index.md", (future, future))
+    (vault / "notes" / "first.md").write_text("# First, edited\n")
+    os.utime(vault / "notes" / "first.md", (future, future))
+    (vault / "notes" / "second.md").unlink()
+    nodes, _ = provider.get_latest_data(None)
+    provider.commit_state()
+
+    # THEN: only the modified and the removed files are returned
+    files = {node.id: node for node in nodes if node.type == "File"}
+    assert set(files) == {"file:notes/first.md", "file:notes/second.md"}
+    assert files["file:notes/second.md"].obsolete
+
+    # THEN: the modified and the removed files keep their creation time
+    created = {node.id: node.created for node in synced_nodes}
+    assert files["file:notes/first.md"].created == created["file:notes/first.md"]
+    assert files["file:notes/second.md"].created == created["file:notes/second.md"]
+
+    # THEN: the renamed heading of the modified file is obsolete
+    headings = {node.id: node.obsolete for node in nodes if node.type == "Heading"}
+    assert headings == {
+        "file:notes/first.md#first-edited": False,
+        "file:notes/first.md#first": True,
+    }
+
+
+def test_wiki_links_by_name(tmp_path):
+    # GIVEN: a vault with wiki links to nested files by name and by path
+    root = tmp_path / "vault"
+    (root / "notes" / "deep").mkdir(parents=True)
+    (root / "notes" / "deep" / "Deep.md").write_text("# Deep\n")
+    (root / "notes" / "Other.md").write_text("# Other\n")
+    (root / "Other.md").write_text("# Other\n")
+    (root / "index.md").write_text("[[Deep]] [[Other]] [[notes/Other]] [[Missing]]\n")
+    provider = FileSystemProvider(str(root))
+
+    # WHEN: latest data is requested
+    _, edges = provider.get_latest_data(None)
+
+    # THEN: links by name resolve to the file anywhere in the vault, the one
+    # closest to the root on conflicts, and links with a path from the root
+    assert {
+        target for source, target, type in edge_tuples(edges) if type == "LINKS_TO"
+    } == {
+        "file:notes/deep/Deep.md",
+        "file:Other.md",
+        "file:notes/Other.md",
+        "file:Missing.md",
+    }
+
+
+def test_heading_ids_are_stable(tmp_path):
+    # GIVEN: a file with repeated headings
+    root = tmp_path / "vault"
+    root.mkdir()
+    (root / "note.md").write_text("# Intro\n## Notes\n# Notes\n## Notes!\n")
+    provider = FileSystemProvider(str(root), mmap_threshold=1)
+
+    # WHEN: latest data is requested
+    nodes, _ = provider.get_latest_data(None)
+
+    # THEN: heading ids are anchors of their titles, read through mmap
+    assert [node.id for node in nodes if node.type == "Heading"] == [
+        "file:note.md#intro",
+        "file:note.md#notes",
+        "file:note.md#notes-1",
+        "file:note.md#notes-2",
+    ]
+
+
+def test_headings_outside_code_blocks(tmp_path):
+    # GIVEN: a file with CRLF line endings and comments in fenced code blocks
+    root = tmp_path / "vault"
+    root.mkdir()
+    (root / "note.md").write_bytes(
+        b"# Setup\r\n```bash\r\n# install deps\r\n```\r\n"
+        b"~~~~\r\n# not closed by ~~~\r\n~~~\r\n~~~~\r\n## Usage\r\n"
+        b"```\r\n# unclosed\r\n"
+    )
+    provider = FileSystemProvider(str(root))
+
+    # WHEN: latest data is requested
+    nodes, _ = provider.get_latest_data(None)
+
+    # THEN: only headings outside code blocks are returned, without the CR
+    assert [node.text for node in nodes if node.type == "Heading"] == [
+        '{"level": 1, "title": "Setup"}',
+        '{"level": 2, "title": "Usage"}',
+    ]
+
+
+def test_get_latest_data_without_commit(vault, tmp_path):
+    # GIVEN: provider which fetched the vault, but the data was not stored
+    index_path = tmp_path / "index.json"
+    provider = FileSystemProvider(str(vault), index_path=str(index_path))
+    nodes, _ = provider.get_latest_data(None)
+
+    # THEN: the index is not saved
+    assert not index_path.exists()
+
+    # WHEN: latest data is requested again
+    # THEN: the same files are returned
+    assert provider.get_latest_data(None)[0] == nodes
+
+
+def test_get_latest_data_without_index(vault):
+    # GIVEN: provider without an index
+    provider = FileSystemProvider(str(vault))
+
+    # WHEN: latest data is requested since a timestamp after all modifications
+    nodes, _ = provider.get_latest_data(datetime.utcnow() + timedelta(minutes=1))
+
+    # THEN: nothing is returned
+    assert nodes == []
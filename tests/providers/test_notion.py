@@ -1,138 +1,16 @@
+import tracemalloc
 from unittest.mock import Mock
 import pytest
 
 from knowledge_bridge.models import EdgeEntity, NodeEntity
 from knowledge_bridge.providers.notion import (
     NotionProvider,
+    format_datetime,
     parse_datetime,
     process_paginated,
 )
 
 
-@pytest.fixture
-def notion_client_mock():
-    page1 = {
-        "id": "page1",
-        "last_edited_time": "2022-01-04T00:00:00.000Z",
-        "created_time": "2022-01-01T00:00:00.000Z",
-        "properties": {},
-        "url": "https://example.com/page1",
-        "in_trash": False,
-        "parent": {
-            "type": "workspace",
-        },
-    }
-    page2 = {
-        "id": "page2",
-        "last_edited_time": "2022-01-05T00:00:00.000Z",
-        "created_time": "2022-01-02T00:00:00.000Z",
-        "properties": {},
-        "url": "https://example.com/page2",
-        "in_trash": True,
-        "parent": {
-            "type": "page",
-            "page": "page1",
-        },
-    }
-    page3 = {
-        "id": "page3",
-        "last_edited_time": "2022-01-01T00:00:00.000Z",
-        "created_time": "2022-01-01T00:00:00.000Z",
-        "properties": {},
-        "url": "https://example.com/page3",
-        "in_trash": True,
-        "parent": {
-            "type": "database",
-            "database": "database1",
-        },
-    }
-    notion_search_page_response = {
-        "results": [page1, page2, page3],
-        "has_more": False,
-    }
-    database1 = {
-        "id": "database1",
-        "last_edited_time": "2022-01-03T00:00:00.000Z",
-        "created_time": "2022-01-01T00:00:00.000Z",
-        "properties": {},
-        "url": "https://example.com/database1",
-        "in_trash": False,
-        "parent": {
-            "type": "page",
-            "page": "page1",
-        },
-    }
-    database2 = {
-        "id": "database2",
-        "last_edited_time": "2022-01-04T00:00:00.000Z",
-        "created_time": "2022-01-02T00:00:00.000Z",
-        "properties": {},
-        "url": "https://example.com/database2",
-        "parent": {"type": "workspace"},
-    }
-    notion_search_database_response = {
-        "results": [database1, database2],
-        "has_more": False,
-    }
-    block1 = {
-        "id": "block1",
-        "type": "paragraph",
-        "paragraph": {"text": [{"type": "text", "text": {"content": "Hello, World!"}}]},
-        "last_edited_time": "2022-01-04T00:00:00.000Z",
-        "created_time": "2022-01-02T00:00:00.000Z",
-        "parent": {
-            "type": "page",
-            "page": "page1",
-        },
-    }
-    block2 = {
-        "id": "page2",
-        "type": "child_page",
-        "last_edited_time": "2022-01-04T00:00:00.000Z",
-        "created_time": "2022-01-02T00:00:00.000Z",
-        "parent": {
-            "type": "page",
-            "page": "page1",
-        },
-    }
-    block3 = {
-        "id": "database1",
-        "type": "child_database",
-        "last_edited_time": "2022-01-04T00:00:00.000Z",
-        "created_time": "2022-01-02T00:00:00.000Z",
-        "parent": {
-            "type": "page",
-            "page": "page1",
-        },
-    }
-    notion_list_block_response = {
-        "results": [block1, block2, block3],
-        "has_more": False,
-    }
-    notion_databases_query_response = {
-        "results": [page3],
-        "has_more": False,
-    }
-
-    def search_method(query, start_cursor=None, filter=None, **kwargs):
-        if filter is None:
-            raise ValueError("Filter is required")
-        if filter["value"] == "page":
-            return notion_search_page_response
-        elif filter["value"] == "database":
-            return notion_search_database_response
-        else:
-            raise ValueError("Invalid filter value")
-
-    mock = Mock()
-    mock.search.side_effect = search_method
-    mock.blocks.children.list.return_value = notion_list_block_response
-    mock.databases.query.return_value = notion_databases_query_response
-    mock.pages.retrieve.return_value = page2
-    mock.databases.retrieve.return_value = database1
-    return mock
-
-
 @pytest.fixture
 def notion_search_endpoint_mock():
     notion_search_endpoint = Mock()
@@ -269,3 +147,330 @@ def test_get_latest_data(notion_client_mock):
         ],
         key=lambda x: x.__hash__(),
     )
+
+
+def test_get_latest_data_watermarks(notion_client_mock):
+    # GIVEN: provider with the watermarks of a previous crawl
+    notion_provider = NotionProvider(client=notion_client_mock)
+    notion_provider.get_latest_data(last_sync_timestamp=None)
+    watermark = notion_provider.crawl_started
+    assert notion_provider.watermarks == {
+        "page1": watermark,
+        "database1": watermark,
+        "database2": watermark,
+    }
+    notion_client_mock.reset_mock()
+
+    # WHEN: latest data is requested again
+    nodes, _ = notion_provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: blocks of the unchanged top-level page are not listed
+    listed_blocks = [
+        call.kwargs["block_id"]
+        for call in notion_client_mock.blocks.children.list.call_args_list
+    ]
+    assert "page1" not in listed_blocks
+
+    # THEN: database rows are queried with last_edited_time filter and sort
+    notion_client_mock.databases.query.assert_any_call(
+        start_cursor=None,
+        database_id="database2",
+        sorts=[{"timestamp": "last_edited_time", "direction": "descending"}],
+        filter={
+            "timestamp": "last_edited_time",
+            "last_edited_time": {"on_or_after": format_datetime(watermark)},
+        },
+    )
+
+    # THEN: watermarks are moved to the start of the crawl
+    assert notion_provider.watermarks == {
+        "page1": watermark,
+        "database1": notion_provider.crawl_started,
+        "database2": notion_provider.crawl_started,
+    }
+
+    # THEN: the unchanged top-level page itself is still returned
+    assert "page1" in [node.id for node in nodes]
+
+
+def test_get_latest_data_watermark_same_minute(notion_client_mock):
+    # GIVEN: provider whose previous crawl started in the minute the top-level
+    # page was last edited, which Notion rounds down to the minute
+    notion_provider = NotionProvider(client=notion_client_mock)
+    notion_provider.watermarks = {"page1": parse_datetime("2022-01-04T00:00:00.000Z")}
+
+    # WHEN: latest data is requested
+    notion_provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: blocks of the page are listed, as it may have changed after the sync
+    notion_client_mock.blocks.children.list.assert_any_call(
+        start_cursor=None, block_id="page1"
+    )
+
+
+def test_get_latest_data_memory_budget(synthetic_notion_client, tmp_path):
+    # GIVEN: a generated workspace and a provider with a small memory budget
+    client = synthetic_notion_client(pages=20, blocks_per_page=50, text_size=1000)
+    notion_provider = NotionProvider(
+        client=client, memory_budget=100_000, spill_dir=str(tmp_path)
+    )
+
+    # WHEN: latest data is requested
+    nodes, edges = notion_provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: node payloads were spilled to disk
+    assert notion_provider.metrics["spilled_nodes"] > 0
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # THEN: all nodes and edges are returned in the crawl order
+    assert len(nodes) == 20 * 51
+    assert len({node.id for node in nodes}) == len(nodes)
+    assert nodes[0].id == "00000000-0000-0000-0000-000000000000"
+    assert nodes[-1].type == "Block"
+    assert len(edges) == 20 * 50
+    assert edges[-1].target.type == "Block"
+
+
+def test_get_latest_data_memory_bounded(synthetic_notion_client, tmp_path):
+    # GIVEN: a generated workspace with about 10 MB of block text and a
+    # provider with a much smaller memory budget
+    client = synthetic_notion_client(pages=20, blocks_per_page=100, text_size=5000)
+    memory_budget = 500_000
+    notion_provider = NotionProvider(
+        client=client, memory_budget=memory_budget, spill_dir=str(tmp_path)
+    )
+
+    # WHEN: latest data is requested and all nodes and edges are read
+    tracemalloc.start()
+    try:
+        nodes, edges = notion_provider.get_latest_data(last_sync_timestamp=None)
+        text_size = sum(len(node.text or "") for node in nodes)
+        edge_count = sum(1 for _ in edges)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # THEN: memory stays within a few budgets, far below the crawled content
+    assert edge_count == 20 * 100
+    assert text_size > 10_000_000
+    assert peak < 4 * memory_budget
+
+
+def test_get_latest_data_without_memory_budget(synthetic_notion_client):
+    # GIVEN: a generated workspace and a provider without a memory budget
+    client = synthetic_notion_client(pages=2, blocks_per_page=3)
+    notion_provider = NotionProvider(client=client)
+
+    # WHEN: latest data is requested
+    nodes, edges = notion_provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: nodes are kept in memory
+    assert isinstance(nodes, list)
+    assert notion_provider.metrics["spilled_nodes"] == 0
+    assert len(nodes) == 8
+    assert len(edges) == 6
+
+
+def test_get_latest_data_references():
+    # GIVEN: a page with relations and a mention in its title
+    page = {
+        "id": "page1",
+        "last_edited_time": "2022-01-04T00:00:00.000Z",
+        "created_time": "2022-01-01T00:00:00.000Z",
+        "properties": {
+            "Name": {
+                "id": "title",
+                "type": "title",
+                "title": [
+                    {"type": "text", "text": {"content": "See "}},
+                    {
+                        "type": "mention",
+                        "mention": {
+                            "type": "database",
+                            "database": {"id": "database9"},
+                        },
+                    },
+                ],
+            },
+            "Related": {
+                "id": "rel1",
+                "type": "relation",
+                "relation": [{"id": "page9"}],
+                "has_more": False,
+            },
+            "Many related": {
+                "id": "rel2",
+                "type": "relation",
+                "relation": [{"id": "page7"}],
+                "has_more": True,
+            },
+        },
+        "url": "https://example.com/page1",
+        "parent": {"type": "workspace"},
+    }
+    # GIVEN: blocks with a page mention and a link to a page
+    blocks = [
+        {
+            "id": "block1",
+            "type": "paragraph",
+            "paragraph": {
+                "rich_text": [
+                    {
+                        "type": "mention",
+                        "mention": {"type": "page", "page": {"id": "page8"}},
+                    },
+                    {
+                        "type": "mention",
+                        "mention": {"type": "user", "user": {"id": "user1"}},
+                    },
+                ]
+            },
+            "last_edited_time": "2022-01-04T00:00:00.000Z",
+            "created_time": "2022-01-02T00:00:00.000Z",
+            "parent": {"type": "page_id", "page_id": "page1"},
+        },
+        {
+            "id": "block2",
+            "type": "link_to_page",
+            "link_to_page": {"type": "page_id", "page_id": "page1"},
+            "last_edited_time": "2022-01-04T00:00:00.000Z",
+            "created_time": "2022-01-02T00:00:00.000Z",
+            "parent": {"type": "page_id", "page_id": "page1"},
+        },
+    ]
+
+    def search_method(query, start_cursor=None, filter=None, **kwargs):
+        if filter["value"] == "database":
+            return {"results": [], "has_more": False}
+        return {"results": [page], "has_more": False}
+
+    client = Mock()
+    client.search.side_effect = search_method
+    client.blocks.children.list.return_value = {"results": blocks, "has_more": False}
+    client.pages.properties.retrieve.return_value = {
+        "results": [
+            {"object": "property_item", "type": "relation", "relation": {"id": id}}
+            for id in ["page7", "page6"]
+        ],
+        "has_more": False,
+    }
+    notion_provider = NotionProvider(client=client)
+
+    # WHEN: latest data is requested
+    nodes, edges = notion_provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: references are returned as typed edges, also to not crawled nodes
+    references = {
+        (edge.source.id, edge.target.id, edge.target.type, edge.type)
+        for edge in edges
+        if not edge.type.startswith("CHILD_")
+    }
+    assert references == {
+        ("page1", "database9", "Database", "MENTIONS"),
+        ("page1", "page9", "Page", "RELATES_TO"),
+        ("page1", "page7", "Page", "RELATES_TO"),
+        ("page1", "page6", "Page", "RELATES_TO"),
+        ("block1", "page8", "Page", "MENTIONS"),
+        ("block2", "page1", "Page", "LINKS_TO"),
+    }
+
+    # THEN: truncated relations are paginated
+    client.pages.properties.retrieve.assert_called_once_with(
+        start_cursor=None, page_id="page1", property_id="rel2"
+    )
+
+
+def test_get_latest_data_prefetched_children(notion_client_mock):
+    # GIVEN: a workspace where all child pages and databases are found by search
+    notion_provider = NotionProvider(client=notion_client_mock)
+
+    # WHEN: latest data is requested
+    notion_provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: child pages and databases are not retrieved one by one
+    notion_client_mock.pages.retrieve.assert_not_called()
+    notion_client_mock.databases.retrieve.assert_not_called()
+    assert notion_provider.metrics["saved_api_calls"] == 2
+    assert notion_provider.metrics["deferred_retrievals"] == 0
+
+    # THEN: prefetched objects are released once processed
+    assert notion_provider.prefetched == {}
+
+
+def test_get_latest_data_deferred_children(notion_client_mock):
+    # GIVEN: a workspace where search doesn't return the child page and database
+    search_method = notion_client_mock.search.side_effect
+
+    def search_without_children(*args, **kwargs):
+        response = search_method(*args, **kwargs)
+        results = [
+            result
+            for result in response["results"]
+            if result["id"] not in ("page2", "database1")
+        ]
+        return {"results": results, "has_more": False}
+
+    notion_client_mock.search.side_effect = search_without_children
+    notion_provider = NotionProvider(client=notion_client_mock)
+
+    # WHEN: latest data is requested
+    nodes, edges = notion_provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: missing children are retrieved once after the crawl
+    notion_client_mock.pages.retrieve.assert_called_once_with("page2")
+    notion_client_mock.databases.retrieve.assert_called_once_with("database1")
+    assert notion_provider.metrics["deferred_retrievals"] == 2
+    assert notion_provider.metrics["saved_api_calls"] == 0
+
+    # THEN: retrieved children are returned with their edges
+    assert {"page2", "database1"} <= {node.id for node in nodes}
+    assert ("page1", "page2", "CHILD_PAGE") in {
+        (edge.source.id, edge.target.id, edge.type) for edge in edges
+    }
+
+
+def test_get_latest_data_not_crawled_parent(notion_client_mock):
+    # GIVEN: a new database row under a database which is not crawled
+    row = {
+        "id": "page4",
+        "last_edited_time": "2022-01-06T00:00:00.000Z",
+        "created_time": "2022-01-06T00:00:00.000Z",
+        "properties": {},
+        "url": "https://example.com/page4",
+        "parent": {"type": "database_id", "database_id": "database9"},
+    }
+    notion_client_mock.search.side_effect = (
+        lambda query, start_cursor=None, filter=None, **kwargs: {
+            "results": [row] if filter["value"] == "page" else [],
+            "has_more": False,
+        }
+    )
+    notion_client_mock.blocks.children.list.return_value = {
+        "results": [],
+        "has_more": False,
+    }
+    notion_provider = NotionProvider(client=notion_client_mock)
+
+    # WHEN: latest data is requested
+    nodes, edges = notion_provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: the row is linked to its database
+    assert [node.id for node in nodes] == ["page4"]
+    assert [
+        (edge.source.id, edge.source.type, edge.target.id, edge.type) for edge in edges
+    ] == [("database9", "Database", "page4", "CHILD_PAGE")]
+
+
+def test_get_latest_data_twice(notion_client_mock):
+    # GIVEN: a provider which already crawled the workspace
+    notion_provider = NotionProvider(client=notion_client_mock)
+    first_nodes, _ = notion_provider.get_latest_data(last_sync_timestamp=None)
+    first_calls = notion_client_mock.blocks.children.list.call_count
+
+    # WHEN: latest data is requested again without stored watermarks
+    notion_provider.watermarks = {}
+    nodes, _ = notion_provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: the workspace is crawled again
+    assert nodes == first_nodes
+    assert notion_client_mock.blocks.children.list.call_count == 2 * first_calls
@@ -0,0 +1,220 @@
+import hashlib
+import hmac
+import json
+from typing import Sequence
+from unittest.mock import Mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from knowledge_bridge.providers.notion import NotionProvider
+from knowledge_bridge.providers.notion_webhook import (
+    NotionWebhookProvider,
+    NotionWebhookReceiver,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def receiver(clock):
+    receiver = NotionWebhookReceiver(debounce=5.0, clock=clock)
+    receiver.start()
+    yield receiver
+    receiver.stop()
+
+
+def post_event(url: str, event: dict, headers: dict | None = None) -> int:
+    # Local stand-in for Notion posting webhook events
+    request = Request(
+        url,
+        data=json.dumps(event).encode("utf-8"),
+        headers={"Content-Type": "application/json", **(headers or {})},
+        method="POST",
+    )
+    try:
+        with urlopen(request) as response:
+            return response.status
+    except HTTPError as e:
+        return e.code
+
+
+def page_event(type: str, page_id: str, updated_blocks: Sequence[str] = ()) -> dict:
+    return {
+        "type": type,
+        "entity": {"id": page_id, "type": "page"},
+        "data": {
+            "updated_blocks": [{"id": id, "type": "block"} for id in updated_blocks]
+        },
+    }
+
+
+def test_receiver_coalesces_and_debounces(receiver, clock):
+    # GIVEN: several events for the same page and one for a database
+    assert (
+        post_event(
+            receiver.url, page_event("page.content_updated", "page1", ["block1"])
+        )
+        == 200
+    )
+    clock.now = 3.0
+    assert (
+        post_event(
+            receiver.url, page_event("page.content_updated", "page1", ["block2"])
+        )
+        == 200
+    )
+    assert (
+        post_event(receiver.url, page_event("page.properties_updated", "page2")) == 200
+    )
+    assert (
+        post_event(
+            receiver.url,
+            {
+                "type": "database.schema_updated",
+                "entity": {"id": "database1", "type": "database"},
+            },
+        )
+        == 200
+    )
+
+    # WHEN: changes are drained before the debounce window of the last event passes
+    clock.now = 6.0
+    # THEN: nothing is ready yet
+    assert receiver.drain() == {}
+
+    # WHEN: the debounce window passes
+    clock.now = 8.0
+    changes = receiver.drain()
+
+    # THEN: events are coalesced per entity
+    assert set(changes) == {"page1", "page2", "database1"}
+    assert changes["page1"].blocks == {"block1", "block2"}
+    assert not changes["page1"].with_blocks
+    assert changes["database1"].kind == "database"
+
+    # THEN: drained changes are removed
+    assert receiver.drain(force=True) == {}
+
+
+def test_receiver_rejects_invalid_requests(clock):
+    # GIVEN: receiver with a verification token
+    receiver = NotionWebhookReceiver(verification_token="secret", clock=clock)
+    receiver.start()
+    try:
+        event = page_event("page.created", "page1")
+        body = json.dumps(event).encode("utf-8")
+        signature = hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+
+        # WHEN: events are posted with a wrong and a valid signature
+        # THEN: only the signed event is accepted
+        assert (
+            post_event(receiver.url, event, {"X-Notion-Signature": "sha256=bad"}) == 401
+        )
+        assert (
+            post_event(
+                receiver.url, event, {"X-Notion-Signature": f"sha256={signature}"}
+            )
+            == 200
+        )
+        assert set(receiver.drain(force=True)) == {"page1"}
+    finally:
+        receiver.stop()
+
+
+def test_receiver_keeps_verification_token(clock, caplog):
+    # GIVEN: receiver
+    receiver = NotionWebhookReceiver(clock=clock)
+
+    # WHEN: the subscription verification request is received
+    receiver.add_event({"verification_token": "secret_token"})
+
+    # THEN: the token is kept, but not logged
+    assert receiver.received_verification_token == "secret_token"
+    assert "secret_token" not in caplog.text
+    assert receiver.drain(force=True) == {}
+
+
+def test_webhook_provider(notion_client_mock, receiver, clock):
+    # GIVEN: webhook provider wrapping a notion provider
+    provider = NotionWebhookProvider(NotionProvider(notion_client_mock), receiver)
+
+    # GIVEN: a created page and a block update of another page
+    post_event(receiver.url, page_event("page.created", "page2"))
+    post_event(receiver.url, page_event("page.content_updated", "page1", ["block1"]))
+    notion_client_mock.pages.retrieve.side_effect = lambda id: {
+        **notion_client_mock.pages.retrieve.return_value,
+        "id": id,
+        "parent": {"type": "workspace"},
+    }
+    notion_client_mock.blocks.retrieve.return_value = (
+        notion_client_mock.blocks.children.list.return_value["results"][0]
+    )
+
+    # WHEN: latest data is requested after the debounce window
+    clock.now = 10.0
+    nodes, edges = provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: only affected pages are retrieved, without searching the workspace
+    notion_client_mock.search.assert_not_called()
+    retrieved = [
+        call.args[0] for call in notion_client_mock.pages.retrieve.call_args_list
+    ]
+    assert retrieved[:2] == ["page2", "page1"]
+
+    # THEN: only the created page lists its blocks, the updated block is fetched
+    listed = [
+        call.kwargs["block_id"]
+        for call in notion_client_mock.blocks.children.list.call_args_list
+    ]
+    assert listed[0] == "page2"
+    assert "page1" not in listed
+    notion_client_mock.blocks.retrieve.assert_called_once_with("block1")
+
+    assert {"page1", "page2", "block1"} <= {node.id for node in nodes}
+    assert ("page1", "block1", "CHILD_BLOCK") in {
+        (edge.source.id, edge.target.id, edge.type) for edge in edges
+    }
+
+
+def test_webhook_provider_keeps_changes_until_commit(clock):
+    # GIVEN: webhook provider with a reported change
+    receiver = NotionWebhookReceiver(clock=clock)
+    notion_provider = Mock(spec=NotionProvider)
+    notion_provider.get_targeted_data.return_value = ([], [])
+    provider = NotionWebhookProvider(notion_provider, receiver)
+    receiver.add_event(page_event("page.content_updated", "page1", ["block1"]))
+    clock.now = 10.0
+
+    # WHEN: latest data is requested, but not committed
+    provider.get_latest_data(last_sync_timestamp=None)
+    receiver.add_event(page_event("page.content_updated", "page1", ["block2"]))
+    clock.now = 20.0
+    provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: the change is fetched again, merged with the newer events
+    assert provider.fetched["page1"].blocks == {"block1", "block2"}
+    assert notion_provider.get_targeted_data.call_args.args[2] == {
+        "block1",
+        "block2",
+    }
+
+    # WHEN: the fetch is committed
+    provider.commit_state()
+    provider.get_latest_data(last_sync_timestamp=None)
+
+    # THEN: the change is discarded
+    assert provider.fetched == {}
+    assert receiver.drain(force=True) == {}
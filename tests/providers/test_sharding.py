@@ -0,0 +1,134 @@
+from datetime import datetime
+from functools import partial
+
+from knowledge_bridge.models import NodeEntity
+from knowledge_bridge.providers.notion import (
+    NotionProvider,
+    crawl_watermark,
+    parse_datetime,
+)
+from knowledge_bridge.providers.sharding import (
+    ShardedNotionProvider,
+    ShardQueue,
+    crawl_shards,
+)
+
+
+def test_shard_queue(tmp_path):
+    # GIVEN: a queue with two shards
+    queue = ShardQueue(str(tmp_path / "queue.sqlite"))
+    queue.put([("page1", "page", {"id": "page1"}), ("db1", "database", {})])
+
+    # WHEN: shards are claimed
+    first = queue.claim()
+    second = queue.claim()
+
+    # THEN: every shard is claimed once
+    assert first == ("page1", "page", {"id": "page1"})
+    assert second == ("db1", "database", {})
+    assert queue.claim() is None
+
+    # WHEN: one shard is completed and the other is released
+    queue.complete("page1", {"nodes": []})
+    queue.release_claimed()
+
+    # THEN: only the completed shard has a result, the released one is pending
+    assert list(queue.results()) == [{"nodes": []}]
+    assert queue.claim() == ("db1", "database", {})
+
+
+def test_sharded_crawl(notion_client_mock, tmp_path):
+    # GIVEN: a workspace where only page1 has blocks
+    blocks = notion_client_mock.blocks.children.list.return_value
+    notion_client_mock.blocks.children.list.side_effect = lambda block_id, **_: (
+        blocks if block_id == "page1" else {"results": [], "has_more": False}
+    )
+
+    # GIVEN: sharded provider and a queue
+    queue_path = str(tmp_path / "queue.sqlite")
+    provider = ShardedNotionProvider(lambda: notion_client_mock, queue_path)
+    queue = ShardQueue(queue_path)
+
+    # WHEN: the workspace is partitioned
+    provider._enqueue_shards(queue, parse_datetime("2022-01-03T00:00:00.000Z"))
+
+    # THEN: only top-level objects become shards
+    assert len(queue) == 2
+
+    # WHEN: shards are crawled and merged
+    assert crawl_shards(lambda: notion_client_mock, queue_path, {}) == 2
+    nodes, edges = provider._merge(queue)
+
+    # THEN: nested objects are taken from the search results of their shard
+    notion_client_mock.pages.retrieve.assert_not_called()
+    notion_client_mock.databases.retrieve.assert_not_called()
+
+    # THEN: the result matches the single process crawl
+    expected_nodes, expected_edges = NotionProvider(
+        client=notion_client_mock
+    ).get_latest_data(parse_datetime("2022-01-03T00:00:00.000Z"))
+    assert sorted(node.id for node in nodes) == sorted(
+        node.id for node in expected_nodes
+    )
+    assert set(edges) == set(expected_edges)
+
+    # THEN: watermarks of the shards are merged
+    assert set(provider.watermarks) == {"page1", "database1", "database2"}
+    assert provider.watermarks["page1"] <= crawl_watermark()
+
+
+def test_get_latest_data_processes(synthetic_notion_client, tmp_path):
+    # GIVEN: sharded provider with a picklable client factory and two processes
+    queue_path = str(tmp_path / "queue.sqlite")
+    client_factory = partial(synthetic_notion_client, pages=4, blocks_per_page=3)
+    provider = ShardedNotionProvider(client_factory, queue_path, processes=2)
+
+    # WHEN: latest data is requested
+    nodes, edges = provider.get_latest_data(None)
+
+    # THEN: all shards are crawled by the worker processes
+    assert len(nodes) == 4 * 4
+    assert len({node.id for node in nodes}) == len(nodes)
+    assert len(edges) == 4 * 3
+
+    # THEN: the queue is cleared
+    assert len(ShardQueue(queue_path)) == 0
+
+
+def test_get_latest_data_resumes_interrupted_crawl(synthetic_notion_client, tmp_path):
+    # GIVEN: a queue of an interrupted crawl, with a shard claimed by a crashed
+    # worker and a shard which was already done
+    queue_path = str(tmp_path / "queue.sqlite")
+    client_factory = partial(synthetic_notion_client, pages=4, blocks_per_page=3)
+    provider = ShardedNotionProvider(client_factory, queue_path, processes=2)
+    queue = ShardQueue(queue_path)
+    provider._enqueue_shards(queue, None)
+    claimed_id, _, _ = queue.claim()
+    done_id, _, _ = queue.claim()
+    done_node = NodeEntity(
+        id="done-node",
+        type="Page",
+        created=datetime(2022, 1, 1),
+        edited=datetime(2022, 1, 1),
+        link=None,
+        text=None,
+    )
+    queue.complete(
+        done_id,
+        {
+            "nodes": [done_node.model_dump(mode="json")],
+            "edges": [],
+            "references": {},
+            "watermarks": {},
+        },
+    )
+
+    # WHEN: latest data is requested
+    nodes, _ = provider.get_latest_data(None)
+
+    # THEN: the done shard is not crawled again, the claimed one is
+    ids = {node.id for node in nodes}
+    assert "done-node" in ids
+    assert done_id not in ids
+    assert claimed_id in ids
+    assert len(nodes) == 3 * 4 + 1
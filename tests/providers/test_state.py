@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from knowledge_bridge.models import NodeEntity
+from knowledge_bridge.providers.state import CrawlState
+
+
+def make_node(index: int) -> NodeEntity:
+    return NodeEntity(
+        id=f"node{index}",
+        type="Block",
+        created=datetime(2022, 1, 1),
+        edited=datetime(2022, 1, 1),
+        link=None,
+        text="x" * 100,
+    )
+
+
+def test_spilled_nodes_slices(tmp_path):
+    # GIVEN: crawl state which spilled part of its nodes to disk
+    state = CrawlState(memory_budget=5000, spill_dir=str(tmp_path))
+    for index in range(12):
+        state.add_node(make_node(index))
+    nodes = state.nodes()
+    assert 0 < state.spilled < 12
+
+    # WHEN: slices over spilled and resident nodes are read
+    # THEN: nodes are returned in the crawl order
+    for start, stop in [(0, 12), (0, 3), (2, state.spilled + 2), (10, 20)]:
+        assert [node.id for node in nodes[start:stop]] == [
+            f"node{index}" for index in range(start, min(stop, 12))
+        ]
+    assert [node.id for node in nodes[::5]] == ["node0", "node5", "node10"]
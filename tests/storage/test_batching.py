@@ -0,0 +1,125 @@
+from unittest.mock import Mock
+
+from neo4j.exceptions import ClientError, TransientError
+import pytest
+
+from knowledge_bridge.storage.batching import AdaptiveBatcher
+
+
+class MemoryLimitError(TransientError):
+    code = "Neo.TransientError.General.TransactionMemoryLimit"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_batches_grow_while_commits_are_fast():
+    # GIVEN: a batcher and commits which take no time
+    batcher = AdaptiveBatcher("test", initial_rows=2, clock=FakeClock())
+    batches = []
+
+    # WHEN: items are written
+    transactions = batcher.run(range(30), lambda item: 1, batches.append)
+
+    # THEN: every batch is twice as big as the previous one
+    assert [len(batch) for batch in batches] == [2, 4, 8, 16]
+    assert transactions == 4
+    assert [item for batch in batches for item in batch] == list(range(30))
+
+
+def test_batches_shrink_when_commits_are_slow():
+    # GIVEN: a batcher and commits which take longer than the target latency
+    clock = FakeClock()
+    batcher = AdaptiveBatcher(
+        "test", initial_rows=8, target_latency=1.0, min_rows=2, clock=clock
+    )
+    batches = []
+
+    def write(batch):
+        batches.append(batch)
+        clock.now += 2.0
+
+    # WHEN: items are written
+    batcher.run(range(20), lambda item: 1, write)
+
+    # THEN: batches are halved down to the minimum size
+    assert [len(batch) for batch in batches] == [8, 4, 2, 2, 2, 2]
+    assert batcher.rows == 2
+
+
+def test_rejected_batch_is_split_and_retried():
+    # GIVEN: a server which rejects transactions of more than 3 rows
+    batcher = AdaptiveBatcher("test", initial_rows=8, clock=FakeClock())
+    batches = []
+
+    def write(batch):
+        if len(batch) > 3:
+            raise MemoryLimitError("Transaction memory limit exceeded")
+        batches.append(batch)
+
+    # WHEN: items are written
+    batcher.run(range(8), lambda item: 1, write)
+
+    # THEN: all items are written once in smaller batches
+    assert [item for batch in batches for item in batch] == list(range(8))
+    assert all(len(batch) <= 3 for batch in batches)
+
+
+def test_transient_errors_are_retried():
+    # GIVEN: a server which deadlocks twice
+    batcher = AdaptiveBatcher("test", initial_rows=4, backoff=0, clock=FakeClock())
+    batches = []
+    errors = [TransientError("Deadlock"), TransientError("Deadlock")]
+
+    def write(batch):
+        if errors:
+            raise errors.pop()
+        batches.append(batch)
+
+    # WHEN: items are written
+    batcher.run(range(4), lambda item: 1, write)
+
+    # THEN: the batch is retried at the same size
+    assert batches == [[0, 1, 2, 3]]
+
+
+def test_transient_errors_are_raised_after_max_retries():
+    # GIVEN: a server which always deadlocks
+    batcher = AdaptiveBatcher("test", max_retries=1, backoff=0, clock=FakeClock())
+    write = Mock(side_effect=TransientError("Deadlock"))
+
+    # WHEN: items are written
+    # THEN: the error is raised after retries are exhausted
+    with pytest.raises(TransientError):
+        batcher.run(range(4), lambda item: 1, write)
+    assert write.call_count == 2
+
+
+def test_other_errors_are_raised():
+    # GIVEN: a server which rejects transactions for another reason
+    batcher = AdaptiveBatcher("test", clock=FakeClock())
+
+    def write(batch):
+        raise ClientError("Syntax error")
+
+    # WHEN: items are written
+    # THEN: the error is raised
+    with pytest.raises(ClientError):
+        batcher.run(range(8), lambda item: 1, write)
+
+
+def test_batches_are_limited_by_bytes():
+    # GIVEN: a batcher with a byte limit and items of 10 bytes
+    batcher = AdaptiveBatcher("test", initial_rows=100, max_bytes=25, clock=FakeClock())
+    batches = []
+
+    # WHEN: items are written
+    batcher.run(range(5), lambda item: 10, batches.append)
+
+    # THEN: batches hold as many items as fit into the byte limit
+    assert [len(batch) for batch in batches] == [2, 2, 1]
@@ -0,0 +1,44 @@
+import pytest
+
+from knowledge_bridge.storage.blob import (
+    BaseBlobStore,
+    FileSystemBlobStore,
+    SQLiteBlobStore,
+)
+
+
+@pytest.fixture(params=["filesystem", "sqlite"])
+def blob_store(request, tmp_path) -> BaseBlobStore:
+    if request.param == "filesystem":
+        return FileSystemBlobStore(str(tmp_path / "blobs"))
+    return SQLiteBlobStore(str(tmp_path / "blobs.sqlite"))
+
+
+def test_put_and_get(blob_store):
+    # GIVEN: a large text
+    text = '{"text": "Hello, World!"}' * 1000
+
+    # WHEN: the text is put into the store
+    key = blob_store.put(text)
+
+    # THEN: the key is the content hash and the text can be read back
+    assert key == BaseBlobStore.hash(text)
+    assert blob_store.contains(key)
+    assert blob_store.get(key) == text
+
+
+def test_put_deduplicates(blob_store):
+    # WHEN: the same text is put twice
+    first = blob_store.put("duplicated template")
+    second = blob_store.put("duplicated template")
+
+    # THEN: both calls return the same key
+    assert first == second
+    assert blob_store.get(first) == "duplicated template"
+
+
+def test_get_missing(blob_store):
+    # WHEN: a missing key is requested
+    # THEN: KeyError is raised
+    with pytest.raises(KeyError):
+        blob_store.get(BaseBlobStore.hash("missing"))
@@ -1,10 +1,17 @@
 from datetime import datetime
 from typing import Generator
-from neo4j import Session
+from neo4j import Driver, Session
 import pytest
 
 from knowledge_bridge.models import EdgeEntity, NodeEntity
-from knowledge_bridge.storage.neo4j import get_neo4j_session, Neo4jGraphStorage
+from knowledge_bridge.storage.batching import AdaptiveBatcher
+from knowledge_bridge.storage.blob import SQLiteBlobStore
+from knowledge_bridge.storage.neo4j import (
+    get_neo4j_driver,
+    get_neo4j_session,
+    Neo4jGraphStorage,
+)
+from knowledge_bridge.storage.scheduling import Neo4jWriteScheduler
 
 
 @pytest.fixture
@@ -13,6 +20,12 @@ def database_session() -> Generator[Session, None, None]:
         yield session
 
 
+@pytest.fixture
+def database_driver() -> Generator[Driver, None, None]:
+    with get_neo4j_driver(uri="neo4j://localhost:7697") as driver:
+        yield driver
+
+
 @pytest.fixture
 def provider_name_for_tests() -> str:
     return "provider_for_tests"
@@ -202,3 +215,207 @@ def test_incremental_data_sync_update(
     # THEN: the number of sync metadata nodes is expected
     result = database_session.run("MATCH (n:Sync) RETURN count(n) as count")
     assert result.single()["count"] == 2
+
+
+def test_incremental_data_sync_blob_store(
+    database_session, provider_name_for_tests, nodes_and_edges, tmp_path
+):
+    # GIVEN: Neo4jGraphStorage instance with a blob store
+    blob_store = SQLiteBlobStore(str(tmp_path / "blobs.sqlite"))
+    storage = Neo4jGraphStorage(
+        database_session, blob_store=blob_store, blob_threshold=10
+    )
+
+    # GIVEN: a list of nodes and edges
+    nodes, edges = nodes_and_edges
+
+    # WHEN: incremental_data_sync is called with the provider and the nodes and edges
+    storage.incremental_data_sync(provider_name_for_tests, nodes, edges)
+
+    # THEN: large text is offloaded to the blob store
+    result = database_session.run(
+        "MATCH (n:Block {id: 'block1'}) RETURN n.text AS text, n.text_hash AS text_hash, n.text_length AS text_length"
+    )
+    record = result.single()
+    assert record["text"] is None
+    assert record["text_hash"] == blob_store.hash(nodes[1].text)
+    assert record["text_length"] == len(nodes[1].text)
+
+    # THEN: small text is stored inline
+    result = database_session.run(
+        "MATCH (n:Page {id: 'page1'}) RETURN n.text AS text, n.text_hash AS text_hash"
+    )
+    record = result.single()
+    assert record["text"] == "{}"
+    assert record["text_hash"] is None
+
+    # THEN: offloaded text can be read lazily
+    assert storage.get_node_text(nodes[1]) == nodes[1].text
+    assert storage.get_node_text(nodes[0]) == "{}"
+
+
+def test_watermarks(database_session, provider_name_for_tests):
+    # GIVEN: Neo4jGraphStorage instance
+    storage = Neo4jGraphStorage(database_session)
+
+    # WHEN: get_watermarks is called with a provider that has no data
+    # THEN: empty watermarks are returned
+    assert storage.get_watermarks(provider_name_for_tests) == {}
+
+    # WHEN: watermarks are set twice
+    watermarks = {
+        "database1": datetime(2022, 1, 1, 10, 0),
+        "page1": datetime(2022, 1, 2, 10, 0),
+    }
+    storage.set_watermarks(provider_name_for_tests, watermarks)
+    watermarks["database1"] = datetime(2022, 1, 3, 10, 0)
+    storage.set_watermarks(provider_name_for_tests, watermarks)
+
+    # THEN: latest watermarks are returned
+    assert storage.get_watermarks(provider_name_for_tests) == watermarks
+
+    # THEN: one watermark node is stored per container
+    result = database_session.run("MATCH (n:Watermark) RETURN count(n) as count")
+    assert result.single()["count"] == 2
+
+
+def test_incremental_data_sync_write_scheduler(
+    database_session, database_driver, provider_name_for_tests, nodes_and_edges
+):
+    # GIVEN: Neo4jGraphStorage instance with a parallel write scheduler
+    scheduler = Neo4jWriteScheduler(database_driver, max_workers=4, chunk_size=2)
+    storage = Neo4jGraphStorage(database_session, write_scheduler=scheduler)
+
+    # GIVEN: a list of nodes and edges
+    nodes, edges = nodes_and_edges
+
+    # WHEN: incremental_data_sync is called twice
+    storage.incremental_data_sync(provider_name_for_tests, nodes, edges)
+    storage.incremental_data_sync(provider_name_for_tests, nodes, edges)
+
+    # THEN: nodes and edges are created once
+    result = database_session.run("MATCH (n) WHERE NOT n:Sync RETURN count(n) as count")
+    assert result.single()["count"] == len(nodes)
+    result = database_session.run(
+        "MATCH (n)-[r]->(m) WHERE NOT n:Sync RETURN count(r) as count"
+    )
+    assert result.single()["count"] == len(edges)
+
+    # THEN: every sync metadata node has edges to all nodes
+    result = database_session.run(
+        "MATCH (n:Sync)-[r:SYNC]->() RETURN count(r) as count"
+    )
+    assert result.single()["count"] == 2 * len(nodes)
+
+
+def test_incremental_data_sync_adaptive_batchers(
+    database_session, provider_name_for_tests, nodes_and_edges
+):
+    # GIVEN: Neo4jGraphStorage instance with small adaptive batches
+    storage = Neo4jGraphStorage(
+        database_session,
+        node_batcher=AdaptiveBatcher("nodes", initial_rows=1),
+        edge_batcher=AdaptiveBatcher("edges", initial_rows=1),
+    )
+
+    # GIVEN: a list of nodes and edges
+    nodes, edges = nodes_and_edges
+
+    # WHEN: incremental_data_sync is called
+    storage.incremental_data_sync(provider_name_for_tests, nodes, edges)
+
+    # THEN: all nodes and edges are created
+    result = database_session.run("MATCH (n) WHERE NOT n:Sync RETURN count(n) as count")
+    assert result.single()["count"] == len(nodes)
+    result = database_session.run(
+        "MATCH (n)-[r]->(m) WHERE NOT n:Sync RETURN count(r) as count"
+    )
+    assert result.single()["count"] == len(edges)
+
+
+def test_incremental_data_sync_write_chunks(
+    database_session, provider_name_for_tests, nodes_and_edges
+):
+    # GIVEN: Neo4jGraphStorage instance which writes two rows per transaction
+    storage = Neo4jGraphStorage(database_session, write_chunk_size=2)
+
+    # GIVEN: a list of nodes and edges
+    nodes, edges = nodes_and_edges
+
+    # WHEN: incremental_data_sync is called
+    storage.incremental_data_sync(provider_name_for_tests, nodes, edges)
+
+    # THEN: all nodes, edges and sync edges are created
+    result = database_session.run("MATCH (n) WHERE NOT n:Sync RETURN count(n) as count")
+    assert result.single()["count"] == len(nodes)
+    result = database_session.run(
+        "MATCH (n)-[r]->(m) WHERE NOT n:Sync RETURN count(r) as count"
+    )
+    assert result.single()["count"] == len(edges)
+    result = database_session.run(
+        "MATCH (n:Sync)-[r:SYNC]->() RETURN count(r) as count"
+    )
+    assert result.single()["count"] == len(nodes)
+
+
+def test_incremental_data_sync_deletes_stale_references(
+    database_session, provider_name_for_tests, nodes_and_edges
+):
+    # GIVEN: Neo4jGraphStorage instance with a page which mentions two pages
+    storage = Neo4jGraphStorage(database_session)
+    nodes, edges = nodes_and_edges
+    mentions = [
+        EdgeEntity(source=nodes[0], target=nodes[2], type="MENTIONS"),
+        EdgeEntity(source=nodes[0], target=nodes[4], type="MENTIONS"),
+    ]
+    storage.incremental_data_sync(provider_name_for_tests, nodes, edges + mentions)
+
+    # WHEN: stale edges of the page are counted without a write
+    counted = storage.count_stale_edges([nodes[0]], mentions[:1], ["MENTIONS"])
+
+    # THEN: the removed mention is counted, but kept
+    assert counted == 1
+    assert storage.count_stale_edges([nodes[0]], mentions[:1], ["MENTIONS"]) == 1
+
+    # WHEN: the page is synced again with only one of the mentions
+    deleted = storage.delete_stale_edges([nodes[0]], mentions[:1], ["MENTIONS"])
+    storage.incremental_data_sync(provider_name_for_tests, [nodes[0]], mentions[:1])
+
+    # THEN: the removed mention is deleted
+    assert deleted == 1
+    result = database_session.run(
+        "MATCH (:Page {id: 'page1'})-[:MENTIONS]->(n) RETURN collect(n.id) AS ids"
+    )
+    assert result.single()["ids"] == ["page2"]
+
+    # THEN: other edges of the page are kept
+    result = database_session.run(
+        "MATCH (:Page {id: 'page1'})-[r]->() WHERE type(r) STARTS WITH 'CHILD_' "
+        "RETURN count(r) AS count"
+    )
+    assert result.single()["count"] == 3
+
+
+def test_get_node_fingerprints_and_existing_edges(
+    database_session, provider_name_for_tests, nodes_and_edges
+):
+    # GIVEN: Neo4jGraphStorage instance with synced nodes and edges
+    storage = Neo4jGraphStorage(database_session)
+    nodes, edges = nodes_and_edges
+    storage.incremental_data_sync(provider_name_for_tests, nodes[:3], edges[1:3])
+
+    # WHEN: fingerprints of all nodes are requested
+    fingerprints = storage.get_node_fingerprints(nodes)
+
+    # THEN: only stored nodes are returned with their fingerprints
+    assert fingerprints == {
+        node.id: (node.fingerprint, node.obsolete) for node in nodes[:3]
+    }
+
+    # WHEN: existing edges are requested
+    existing = storage.get_existing_edges(edges)
+
+    # THEN: only stored edges are returned
+    assert existing == {
+        (edge.source.id, edge.target.id, edge.type) for edge in edges[1:3]
+    }
@@ -0,0 +1,168 @@
+from datetime import datetime
+from unittest.mock import MagicMock, Mock
+
+from neo4j.exceptions import TransientError
+import pytest
+
+from knowledge_bridge.models import BaseNodeEntity, EdgeEntity, NodeEntity
+from knowledge_bridge.storage.scheduling import (
+    Neo4jWriteScheduler,
+    partition_edges,
+    partition_nodes,
+)
+
+
+def make_node(id: str) -> NodeEntity:
+    return NodeEntity(
+        id=id,
+        type="Block",
+        created=datetime.now(),
+        edited=datetime.now(),
+        link=None,
+        text=None,
+    )
+
+
+def make_edge(source: str, target: str) -> EdgeEntity:
+    return EdgeEntity(
+        source=BaseNodeEntity(id=source, type="Page"),
+        target=BaseNodeEntity(id=target, type="Block"),
+        type="CHILD_BLOCK",
+    )
+
+
+def test_partition_nodes():
+    # GIVEN: nodes
+    nodes = [make_node(f"block{i}") for i in range(10)]
+
+    # WHEN: nodes are partitioned
+    chunks = list(partition_nodes(nodes, chunk_size=2, partitions=3))
+
+    # THEN: every node is in exactly one chunk of at most the chunk size
+    assert sorted(node.id for _, chunk in chunks for node in chunk) == sorted(
+        node.id for node in nodes
+    )
+    assert all(len(chunk) <= 2 for _, chunk in chunks)
+    assert {index for index, _ in chunks} <= {0, 1, 2}
+
+
+def test_partition_reads_lazily():
+    # GIVEN: a stream of nodes
+    read = []
+
+    def nodes():
+        for i in range(100):
+            read.append(i)
+            yield make_node(f"block{i}")
+
+    # WHEN: the first chunk is taken
+    next(partition_nodes(nodes(), chunk_size=2, partitions=1))
+
+    # THEN: only the nodes of that chunk were read
+    assert read == [0, 1]
+
+
+def test_partition_edges():
+    # GIVEN: edges of a hub page and two small pages
+    edges = [make_edge("hub", f"block{i}") for i in range(3)]
+    edges += [make_edge("page1", "block4"), make_edge("page2", "block5")]
+
+    # WHEN: edges are partitioned
+    chunks = list(partition_edges(edges, chunk_size=2, partitions=4))
+
+    # THEN: all edges of a source node are in the same partition
+    partitions: dict[str, set[int]] = {}
+    for index, chunk in chunks:
+        for edge in chunk:
+            partitions.setdefault(edge.source.id, set()).add(index)
+    assert all(len(indexes) == 1 for indexes in partitions.values())
+
+    # THEN: edges of the hub span chunks of at most the chunk size, in order
+    hub_chunks = [
+        [edge.target.id for edge in chunk]
+        for _, chunk in chunks
+        if chunk[0].source.id == "hub"
+    ]
+    assert [target for chunk in hub_chunks for target in chunk][:3] == [
+        "block0",
+        "block1",
+        "block2",
+    ]
+    assert all(len(chunk) <= 2 for _, chunk in chunks)
+
+
+@pytest.fixture
+def driver_mock():
+    driver = MagicMock()
+    session = driver.session.return_value.__enter__.return_value
+    return driver, session.begin_transaction.return_value.__enter__.return_value
+
+
+def test_run(driver_mock):
+    # GIVEN: scheduler with a mocked driver
+    driver, tx = driver_mock
+    scheduler = Neo4jWriteScheduler(driver, max_workers=2)
+    work = Mock()
+
+    # WHEN: chunks are written
+    scheduler.run(work, [[1, 2], [3], [4]])
+
+    # THEN: every chunk is written and committed in its own transaction
+    assert sorted(call.args[1] for call in work.call_args_list) == [[1, 2], [3], [4]]
+    assert tx.commit.call_count == 3
+
+
+def test_run_partitioned(driver_mock):
+    # GIVEN: scheduler with a mocked driver
+    driver, tx = driver_mock
+    scheduler = Neo4jWriteScheduler(driver, max_workers=2)
+    written = []
+    work = Mock(side_effect=lambda tx, chunk: written.append(chunk))
+
+    # WHEN: chunks of two partitions are written
+    scheduler.run_partitioned(work, iter([(0, [1, 2]), (1, [4]), (0, [3])]))
+
+    # THEN: every chunk is written in its own transaction, in order within a
+    # partition
+    assert sorted(written) == [[1, 2], [3], [4]]
+    assert written.index([1, 2]) < written.index([3])
+    assert tx.commit.call_count == 3
+
+
+def test_run_partitioned_raises_errors(driver_mock):
+    # GIVEN: work which fails on a chunk
+    driver, _ = driver_mock
+    scheduler = Neo4jWriteScheduler(driver, max_workers=2)
+    work = Mock(side_effect=ValueError())
+
+    # WHEN: more chunks than the queues can hold are written
+    # THEN: the error is raised
+    with pytest.raises(ValueError):
+        scheduler.run_partitioned(work, ((0, [i]) for i in range(10)))
+
+
+def test_run_retries_transient_errors(driver_mock):
+    # GIVEN: work which deadlocks twice
+    driver, tx = driver_mock
+    scheduler = Neo4jWriteScheduler(driver, max_retries=2, backoff=0)
+    work = Mock(side_effect=[TransientError(), TransientError(), None])
+
+    # WHEN: a chunk is written
+    scheduler.run(work, [[1]])
+
+    # THEN: the chunk is retried until it succeeds
+    assert work.call_count == 3
+    assert tx.commit.call_count == 1
+
+
+def test_run_gives_up_after_max_retries(driver_mock):
+    # GIVEN: work which always deadlocks
+    driver, _ = driver_mock
+    scheduler = Neo4jWriteScheduler(driver, max_retries=1, backoff=0)
+    work = Mock(side_effect=TransientError())
+
+    # WHEN: a chunk is written
+    # THEN: the error is raised after retries are exhausted
+    with pytest.raises(TransientError):
+        scheduler.run(work, [[1]])
+    assert work.call_count == 2
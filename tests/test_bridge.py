@@ -53,3 +53,84 @@ def test_sync():
         ["node3", "node4"],
         ["edge3", "edge4"],
     )
+
+
+def test_sync_watermarks():
+    # GIVEN: storage mock with stored watermarks
+    graph_storage = Mock(spec=BaseGraphStorage)
+    graph_storage.get_last_sync_timestamp.return_value = None
+    watermarks = {"database1": datetime(2021, 1, 1)}
+    graph_storage.get_watermarks.return_value = watermarks
+
+    # GIVEN: provider mock which advances a watermark
+    provider = Mock(spec=BaseProvider)
+
+    def get_latest_data_side_effect(last_sync_timestamp):
+        assert provider.watermarks == {"database1": datetime(2021, 1, 1)}
+        provider.watermarks = {"database1": datetime(2021, 1, 2)}
+        return [], []
+
+    provider.get_latest_data.side_effect = get_latest_data_side_effect
+
+    # WHEN: we sync the bridge
+    bridge = Bridge(graph_storage=graph_storage, providers={"provider": provider})
+    bridge.sync()
+
+    # THEN: watermarks are loaded before and persisted after the sync
+    graph_storage.get_watermarks.assert_called_once_with("provider")
+    graph_storage.set_watermarks.assert_called_once_with(
+        "provider", {"database1": datetime(2021, 1, 2)}
+    )
+
+
+def test_sync_shared_watermarks():
+    # GIVEN: storage mock and a webhook provider sharing watermarks of a poller
+    graph_storage = Mock(spec=BaseGraphStorage)
+    graph_storage.get_last_sync_timestamp.return_value = None
+    graph_storage.get_watermarks.return_value = {}
+    provider = Mock(spec=BaseProvider)
+    provider.get_latest_data.return_value = ([], [])
+
+    # WHEN: we sync the bridge
+    bridge = Bridge(
+        graph_storage=graph_storage,
+        providers={"notion_webhook": provider},
+        shared_watermarks={"notion_webhook": "notion"},
+    )
+    bridge.sync()
+
+    # THEN: sync timestamp and metadata are kept under the own name
+    graph_storage.get_last_sync_timestamp.assert_called_once_with("notion_webhook")
+    graph_storage.incremental_data_sync.assert_called_once_with(
+        "notion_webhook", [], []
+    )
+
+    # THEN: watermarks are loaded and persisted under the shared name
+    graph_storage.get_watermarks.assert_called_once_with("notion")
+    graph_storage.set_watermarks.assert_called_once_with("notion", {})
+
+
+def test_sync_commits_provider_state_after_storing():
+    # GIVEN: storage mock which checks that provider state is not committed yet
+    graph_storage = Mock(spec=BaseGraphStorage)
+    graph_storage.get_last_sync_timestamp.return_value = None
+    provider = Mock(spec=BaseProvider)
+    provider.get_latest_data.return_value = ([], [])
+
+    def incremental_data_sync_side_effect(name, nodes, edges):
+        provider.commit_state.assert_not_called()
+
+    graph_storage.incremental_data_sync.side_effect = incremental_data_sync_side_effect
+    bridge = Bridge(graph_storage=graph_storage, providers={"provider": provider})
+
+    # WHEN: we plan the sync
+    bridge.plan()
+
+    # THEN: provider state is not committed
+    provider.commit_state.assert_not_called()
+
+    # WHEN: we sync the bridge
+    bridge.sync()
+
+    # THEN: provider state is committed after the data is stored
+    provider.commit_state.assert_called_once_with()
@@ -0,0 +1,112 @@
+from datetime import datetime
+import hashlib
+from unittest.mock import Mock
+
+from knowledge_bridge.bridge import Bridge
+from knowledge_bridge.models import CONTENT_EDGE_TYPES, EdgeEntity, NodeEntity
+from knowledge_bridge.planning import plan_sync
+from knowledge_bridge.providers.base import BaseProvider
+from knowledge_bridge.storage.base import BaseGraphStorage
+
+
+def make_node(id: str, text: str = "{}", obsolete: bool = False) -> NodeEntity:
+    return NodeEntity(
+        id=id,
+        type="Page",
+        created=datetime(2022, 1, 1),
+        edited=datetime(2022, 1, 2),
+        link=None,
+        text=text,
+        obsolete=obsolete,
+    )
+
+
+def test_fingerprint():
+    # GIVEN: a node and its copy with offloaded text
+    node = make_node("page1", text="long text")
+    offloaded = node.model_copy(
+        update={
+            "text": None,
+            "text_hash": hashlib.sha256(b"long text").hexdigest(),
+            "text_length": 9,
+        }
+    )
+
+    # THEN: fingerprint depends on content, not on where the text is stored
+    assert node.fingerprint == offloaded.fingerprint
+    assert node.fingerprint != make_node("page1", text="other text").fingerprint
+
+
+def test_plan_sync():
+    # GIVEN: nodes with different stored states
+    unchanged = make_node("unchanged")
+    updated = make_node("updated", text="new")
+    obsoleted = make_node("obsoleted", obsolete=True)
+    created = make_node("created")
+    nodes = [unchanged, updated, obsoleted, created]
+    edges = [
+        EdgeEntity(source=unchanged, target=updated, type="CHILD_PAGE"),
+        EdgeEntity(source=unchanged, target=created, type="CHILD_PAGE"),
+    ]
+
+    # GIVEN: storage which returns stored fingerprints and edges
+    graph_storage = Mock(spec=BaseGraphStorage)
+    graph_storage.get_node_fingerprints.side_effect = lambda chunk: {
+        id: state
+        for id, state in {
+            "unchanged": (unchanged.fingerprint, False),
+            "updated": (make_node("updated").fingerprint, False),
+            "obsoleted": (make_node("obsoleted").fingerprint, False),
+        }.items()
+        if id in {node.id for node in chunk}
+    }
+    graph_storage.get_existing_edges.return_value = {
+        ("unchanged", "updated", "CHILD_PAGE")
+    }
+    graph_storage.count_stale_edges.return_value = 2
+    graph_storage.estimate_transactions.return_value = 5
+
+    # WHEN: sync is planned in small chunks
+    plan = plan_sync(graph_storage, "provider", nodes, edges, chunk_size=3)
+
+    # THEN: the storage is read chunk by chunk
+    assert graph_storage.get_node_fingerprints.call_count == 2
+    assert graph_storage.get_existing_edges.call_count == 1
+
+    # THEN: changes are classified
+    assert plan.nodes_unchanged == 1
+    assert plan.nodes_to_update == 1
+    assert plan.nodes_to_obsolete == 1
+    assert plan.nodes_to_create == 1
+    assert plan.edges_unchanged == 1
+    assert plan.edges_to_create == 1
+    assert plan.edges_to_delete == 2
+    assert plan.transactions == 5
+    assert plan.write_bytes > 0
+
+    # THEN: stale edges are counted like sync deletes them
+    graph_storage.count_stale_edges.assert_called_once_with(
+        nodes, edges, CONTENT_EDGE_TYPES
+    )
+
+
+def test_bridge_plan():
+    # GIVEN: storage and provider mocks
+    graph_storage = Mock(spec=BaseGraphStorage)
+    graph_storage.get_last_sync_timestamp.return_value = None
+    graph_storage.get_watermarks.return_value = {}
+    graph_storage.get_node_fingerprints.return_value = {}
+    graph_storage.get_existing_edges.return_value = set()
+    graph_storage.count_stale_edges.return_value = 0
+    graph_storage.estimate_transactions.return_value = 4
+    provider = Mock(spec=BaseProvider)
+    provider.get_latest_data.return_value = ([make_node("page1")], [])
+
+    # WHEN: sync is planned
+    bridge = Bridge(graph_storage=graph_storage, providers={"provider": provider})
+    plans = bridge.plan()
+
+    # THEN: a plan is returned and nothing is written
+    assert plans["provider"].nodes_to_create == 1
+    graph_storage.incremental_data_sync.assert_not_called()
+    graph_storage.set_watermarks.assert_not_called()
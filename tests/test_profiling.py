@@ -0,0 +1,123 @@
+import json
+import time
+import tracemalloc
+from unittest.mock import Mock
+
+import pytest
+
+from knowledge_bridge.bridge import Bridge
+from knowledge_bridge.profiling import NULL_PROFILER, Profiler
+from knowledge_bridge.providers.base import BaseProvider
+from knowledge_bridge.storage.base import BaseGraphStorage
+
+
+def busy(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        json.dumps({"text": "Hello, World!"})
+
+
+@pytest.mark.parametrize("backend", ["cprofile", "tracemalloc"])
+def test_profiler_nested_stages(backend, tmp_path):
+    # GIVEN: a profiler
+    profiler = Profiler(backend=backend, output_dir=str(tmp_path), top_n=5)
+
+    # WHEN: nested stages are profiled
+    with profiler.stage("fetch"):
+        busy(0.02)
+        for _ in range(3):
+            with profiler.stage("transform"):
+                busy(0.01)
+    summary = profiler.report()
+
+    # THEN: calls are counted and the nested time is attributed to the inner stage
+    assert profiler.stages["fetch"].calls == 1
+    assert profiler.stages["transform"].calls == 3
+    assert profiler.stages["transform"].seconds >= 0.03
+    assert profiler.stages["fetch"].seconds < 0.03 + 0.02
+
+    # THEN: summary and profile dumps are written
+    assert "fetch: 1 calls" in summary
+    assert "transform: 3 calls" in summary
+    if backend == "cprofile":
+        assert (tmp_path / "fetch.prof").exists()
+        assert (tmp_path / "transform.prof").exists()
+    else:
+        assert (tmp_path / "fetch.tracemalloc.txt").exists()
+
+
+def test_profiler_unknown_backend():
+    with pytest.raises(ValueError):
+        Profiler(backend="perf")
+
+
+def test_sync_profile():
+    # GIVEN: storage and provider mocks
+    graph_storage = Mock(spec=BaseGraphStorage)
+    graph_storage.get_last_sync_timestamp.return_value = None
+    graph_storage.get_watermarks.return_value = {}
+    provider = Mock(spec=BaseProvider)
+    used_profilers = []
+
+    def get_latest_data(last_sync_timestamp):
+        used_profilers.append((provider.profiler, graph_storage.profiler))
+        return [], []
+
+    provider.get_latest_data.side_effect = get_latest_data
+
+    # WHEN: we sync the bridge with a profiler
+    profiler = Profiler()
+    bridge = Bridge(graph_storage=graph_storage, providers={"provider": provider})
+    bridge.sync(profile=profiler)
+
+    # THEN: the profiler is passed to the provider and the storage
+    assert used_profilers == [(profiler, profiler)]
+
+    # THEN: bridge stages are profiled
+    assert set(profiler.stages) == {"fetch", "write_sync_metadata"}
+
+    # THEN: the profiler is detached after the sync
+    assert provider.profiler is NULL_PROFILER
+    assert graph_storage.profiler is NULL_PROFILER
+
+    # WHEN: we sync the bridge without a profiler
+    bridge.sync()
+
+    # THEN: profiling is off
+    assert used_profilers[-1] == (NULL_PROFILER, NULL_PROFILER)
+
+
+def test_sync_profile_failed(tmp_path):
+    # GIVEN: storage mock which fails to write
+    graph_storage = Mock(spec=BaseGraphStorage)
+    graph_storage.get_last_sync_timestamp.return_value = None
+    graph_storage.get_watermarks.return_value = {}
+    graph_storage.incremental_data_sync.side_effect = RuntimeError("write failed")
+    provider = Mock(spec=BaseProvider)
+
+    def get_latest_data(last_sync_timestamp):
+        with provider.profiler.stage("transform"):
+            return [], []
+
+    provider.get_latest_data.side_effect = get_latest_data
+
+    # WHEN: we sync the bridge with a profiler
+    profiler = Profiler(backend="tracemalloc", output_dir=str(tmp_path))
+    bridge = Bridge(graph_storage=graph_storage, providers={"provider": provider})
+    with pytest.raises(RuntimeError):
+        bridge.sync(profile=profiler)
+
+    # THEN: the profile is still reported and tracing is stopped
+    assert (tmp_path / "fetch.tracemalloc.txt").exists()
+    assert not tracemalloc.is_tracing()
+
+    # WHEN: a dry run follows
+    graph_storage.get_node_fingerprints.return_value = {}
+    graph_storage.get_existing_edges.return_value = set()
+    graph_storage.count_stale_edges.return_value = 0
+    graph_storage.estimate_transactions.return_value = 1
+    bridge.plan()
+
+    # THEN: it is not profiled
+    assert not tracemalloc.is_tracing()
+    assert profiler.stages["transform"].calls == 1